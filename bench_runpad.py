@@ -0,0 +1,254 @@
+# Benchmarks de RunPad Pro+: maneja la clase RunPad real sin interfaz visible.
+#   python bench_runpad.py                          # todo, resultados en bench-results.json
+#   python bench_runpad.py --quick                  # tamaños reducidos
+#   python bench_runpad.py --only highlight console
+#   python bench_runpad.py --baseline base.json     # compara contra una ejecución guardada
+# Sin DISPLAY (Linux) arranca Xvfb si está instalado. Se usa un HOME temporal, así que no
+# toca las preferencias, el historial ni los logs del usuario.
+import os, sys, json, time, shutil, subprocess, tempfile, platform, statistics, argparse, importlib.util
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(HERE, "runpad-pro.py")
+
+FULL = {"buffer_lines": [1000, 10000, 100000], "keystrokes": 20, "replace_matches": 20000,
+        "console_lines": 1000000, "dir_files": 100000, "batch_sizes": [10, 100, 500]}
+QUICK = {"buffer_lines": [1000, 10000], "keystrokes": 10, "replace_matches": 2000,
+         "console_lines": 100000, "dir_files": 10000, "batch_sizes": [10, 50]}
+
+# ========= Entorno =========
+def _ensure_display():
+    if os.name == "nt" or sys.platform == "darwin" or os.environ.get("DISPLAY"): return None
+    xvfb = shutil.which("Xvfb")
+    if not xvfb:
+        sys.exit("Sin DISPLAY y sin Xvfb: ejecuta bajo xvfb-run o instala Xvfb.")
+    for n in range(99, 140):
+        if os.path.exists(f"/tmp/.X11-unix/X{n}"): continue
+        proc = subprocess.Popen([xvfb, f":{n}", "-screen", "0", "1600x1000x24", "-nolisten", "tcp"],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        for _ in range(100):
+            if os.path.exists(f"/tmp/.X11-unix/X{n}"):
+                os.environ["DISPLAY"] = f":{n}"; return proc
+            if proc.poll() is not None: break
+            time.sleep(0.05)
+        proc.kill()
+    sys.exit("No se pudo arrancar Xvfb.")
+
+def _load_app(home):
+    # las rutas de preferencias/historial se calculan al importar: HOME va antes
+    os.environ["HOME"] = os.environ["USERPROFILE"] = home
+    spec = importlib.util.spec_from_file_location("runpad_pro", APP_PATH)
+    mod = importlib.util.module_from_spec(spec); spec.loader.exec_module(mod)
+    return mod
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+class Harness:
+    def __init__(self, rp, show=False):
+        self.rp = rp
+        self.root = rp.tk.Tk()
+        if not show: self.root.withdraw()
+        self.app = rp.RunPad(self.root)
+        self.pump(lambda: self.app._panels_ready)
+
+    def pump(self, until, timeout=600.0):
+        # corre el bucle de Tk hasta que `until()` sea cierto
+        end = time.perf_counter() + timeout
+        while not until():
+            if time.perf_counter() > end: raise TimeoutError("el benchmark no terminó a tiempo")
+            self.root.update()
+        self.root.update()
+
+    def idle(self):
+        app = self.app
+        self.pump(lambda: app.output_queue.empty() and app.ui_calls.empty() and not app.console.dirty)
+
+    def set_buffer(self, text):
+        app = self.app
+        app.editor.delete("1.0", "end"); app.editor.insert("1.0", text)
+        app.editor.edit_modified(False); app.file_modified = False
+        self.root.update()
+
+    def close(self):
+        self.app.file_modified = False
+        self.app.supervisor.terminate_all(grace=0.5)
+        self.app.linter.close()
+        self.app._restore_call_wrapper()
+        self.root.destroy()
+
+# ========= Cargas generadas =========
+def _source(lines):
+    block = ["def f_{i}(x, y=3):",
+             "    total = x * 2 + y  # comentario {i}",
+             "    items = [n for n in range({i} % 17) if n % 2]",
+             "    return {{'total': total, 'items': items, \"name\": 'f_{i}'}}",
+             ""]
+    out = []
+    for i in range(lines // len(block) + 1):
+        out.extend(l.format(i=i) for l in block)
+    return "\n".join(out[:lines])
+
+def _timed(fn):
+    t0 = time.perf_counter(); fn(); return time.perf_counter() - t0
+
+# ========= Benchmarks =========
+def bench_highlight(h, cfg):
+    out = {}
+    for n in cfg["buffer_lines"]:
+        h.set_buffer(_source(n))
+        out[f"highlight_{n}"] = {"seconds": _timed(h.app._highlight_all), "lines": n}
+    return out
+
+def bench_typing(h, cfg):
+    # mismo camino que una tecla: inserción, <<Modified>>, KeyRelease (caret + resaltado)
+    out = {}
+    for n in cfg["buffer_lines"]:
+        h.set_buffer(_source(n))
+        h.app.editor.mark_set("insert", f"{n // 2}.0")
+        lat = []
+        # en búferes grandes cada tecla cuesta un resaltado completo: menos muestras
+        for _ in range(max(3, min(cfg["keystrokes"], cfg["keystrokes"] * 10000 // n))):
+            t0 = time.perf_counter()
+            h.app.editor.insert("insert", "x")
+            h.root.update()
+            h.app._update_status_caret(); h.app._highlight_all()
+            h.root.update_idletasks()
+            lat.append(time.perf_counter() - t0)
+        lat.sort()
+        out[f"typing_{n}"] = {"seconds": statistics.median(lat), "lines": n,
+                              "p95": lat[min(len(lat) - 1, int(len(lat) * 0.95))], "max": lat[-1]}
+    return out
+
+def bench_replace(h, cfg):
+    m = cfg["replace_matches"]
+    h.set_buffer("\n".join(f"foo = foo_{i} + 1" for i in range(m // 2)))
+    return {f"replace_{m}": {"seconds": _timed(lambda: h.app._replace_text("foo", "barbaz")), "matches": m}}
+
+def bench_console(h, cfg):
+    app, n = h.app, cfg["console_lines"]
+    app.clear_output(); h.idle()
+    for i in range(n): app.output_queue.put(f"línea {i} \x1b[32mok\x1b[0m\n")
+    t = _timed(h.idle)
+    app.clear_output(); h.idle()
+    return {f"console_{n}": {"seconds": t, "lines": n, "lines_per_sec": n / t if t else None}}
+
+def bench_listing(h, cfg, work):
+    app, n = h.app, cfg["dir_files"]
+    d = os.path.join(work, f"dir_{n}")
+    if not os.path.isdir(d):
+        os.makedirs(d)
+        for i in range(n): open(os.path.join(d, f"f{i:06d}.py"), "w").close()
+    app.current_directory = d
+
+    def run():
+        app._listing = None
+        app.refresh_file_list()
+        h.pump(lambda: app._listing is not None and app._listing[0] == d)
+    return {f"listing_{n}": {"seconds": _timed(run), "files": n}}
+
+def bench_batch(h, cfg, work):
+    app, out = h.app, {}
+    for n in cfg["batch_sizes"]:
+        d = os.path.join(work, f"batch_{n}")
+        os.makedirs(d, exist_ok=True)
+        paths = []
+        for i in range(n):
+            p = os.path.join(d, f"s{i:04d}.py")
+            with open(p, "w", encoding="utf-8") as f: f.write(f"print({i})\n")
+            paths.append(p)
+        app._batch = None
+
+        def run():
+            app.run_scripts_list(paths)
+            h.pump(lambda: app._batch is not None and len(app._batch.results) == n)
+            h.idle()
+        out[f"batch_{n}"] = {"seconds": _timed(run), "scripts": n, "concurrency": app._batch_concurrency()}
+        app.clear_output(); h.idle()
+    return out
+
+BENCHES = {"highlight": bench_highlight, "typing": bench_typing, "replace": bench_replace,
+           "console": bench_console, "listing": bench_listing, "batch": bench_batch}
+
+# ========= Resultados =========
+def _merge(runs):
+    # varias repeticiones → mediana/mín/máx de "seconds"; el resto de campos, de la primera
+    merged = {}
+    for name in runs[0]:
+        samples = sorted(r[name]["seconds"] for r in runs)
+        entry = dict(runs[0][name])
+        entry.update(seconds=statistics.median(samples), min=samples[0], max_run=samples[-1], runs=samples)
+        merged[name] = entry
+    return merged
+
+def compare(current, baseline, threshold):
+    base = baseline.get("results", {})
+    regressions = []
+    width = max([len(n) for n in current] + [9])
+    print(f"\n{'benchmark':<{width}}  {'base (s)':>10}  {'actual (s)':>10}  {'cambio':>8}")
+    for name, res in current.items():
+        old = base.get(name, {}).get("seconds")
+        if not old:
+            print(f"{name:<{width}}  {'—':>10}  {res['seconds']:>10.4f}  {'nuevo':>8}"); continue
+        delta = (res["seconds"] - old) / old * 100
+        flag = ""
+        if delta > threshold: flag = "  ▲ más lento"; regressions.append(name)
+        elif delta < -threshold: flag = "  ▼ más rápido"
+        print(f"{name:<{width}}  {old:>10.4f}  {res['seconds']:>10.4f}  {delta:>+7.1f}%{flag}")
+    return regressions
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmarks de RunPad Pro+")
+    ap.add_argument("--only", nargs="+", choices=sorted(BENCHES), help="benchmarks a ejecutar")
+    ap.add_argument("--quick", action="store_true", help="tamaños reducidos")
+    ap.add_argument("--repeat", type=int, default=3, help="repeticiones por benchmark (mediana)")
+    ap.add_argument("--out", default="bench-results.json", help="archivo JSON de resultados")
+    ap.add_argument("--baseline", help="JSON de una ejecución anterior para comparar")
+    ap.add_argument("--threshold", type=float, default=10.0, help="% de cambio que cuenta como regresión")
+    ap.add_argument("--show", action="store_true", help="mostrar la ventana en vez de retirarla")
+    args = ap.parse_args(argv)
+    cfg = QUICK if args.quick else FULL
+
+    xvfb = _ensure_display()
+    work = tempfile.mkdtemp(prefix="runpad-bench-")
+    try:
+        os.makedirs(os.path.join(work, "home"))
+        rp = _load_app(os.path.join(work, "home"))
+        h = Harness(rp, show=args.show)
+        results = {}
+        try:
+            for key in args.only or list(BENCHES):
+                fn = BENCHES[key]
+                runs = []
+                for _ in range(max(1, args.repeat)):
+                    runs.append(fn(h, cfg, work) if key in ("listing", "batch") else fn(h, cfg))
+                merged = _merge(runs)
+                for name, res in merged.items():
+                    print(f"{name:<24} {res['seconds']:.4f} s  (mín {res['min']:.4f}, máx {res['max_run']:.4f})",
+                          flush=True)
+                results.update(merged)
+        finally:
+            h.close()
+        doc = {"meta": {"date": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": _git_commit(),
+                        "python": platform.python_version(), "tk": str(rp.tk.TkVersion),
+                        "platform": platform.platform(), "cpus": os.cpu_count(),
+                        "quick": args.quick, "repeat": args.repeat, "config": cfg},
+               "results": results}
+        with open(args.out, "w", encoding="utf-8") as f: json.dump(doc, f, indent=2)
+        print(f"\nResultados en {args.out}")
+        if args.baseline:
+            with open(args.baseline, "r", encoding="utf-8") as f: baseline = json.load(f)
+            regressions = compare(results, baseline, args.threshold)
+            if regressions:
+                print(f"\n{len(regressions)} regresión(es) por encima del {args.threshold:g}%")
+                return 1
+        return 0
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+        if xvfb is not None: xvfb.terminate()
+
+if __name__ == "__main__":
+    sys.exit(main())
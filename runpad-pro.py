@@ -1,6 +1,17 @@
-import os, sys, subprocess, threading, queue, json, shutil, time, tkinter as tk
-from tkinter import filedialog, messagebox, ttk, simpledialog, colorchooser
+import time
+_T_START = time.perf_counter()  # para --startup-profile
+import os, sys, subprocess, threading, queue, json, hashlib, heapq, itertools, bisect, zlib, tkinter as tk
+from tkinter import filedialog, messagebox, ttk
 import tkinter.font as tkfont
+import ast, importlib.util, re, codecs, locale
+from collections import deque
+import signal
+# Importaciones poco usadas (shutil, sqlite3, statistics, glob, shlex, py_compile,
+# multiprocessing, concurrent.futures, simpledialog, colorchooser) se hacen donde se usan.
+try:
+    import resource  # solo POSIX
+except ImportError:
+    resource = None
 
 # ========= Theme =========
 BG_COLOR   = "#1e1e1e"
@@ -24,7 +35,16 @@ DEFAULT_EXTS = [
     '.sql','.yaml','.yml','.xml','.ini','.cfg','.toml'
 ]
 
+CLEAR_CONSOLE = object()  # marcador en output_queue: vaciar la consola en orden
+DOC_TAGS = ("sym", "num", "alpha", "diag_error", "diag_warn")  # se guardan con cada pestaña inactiva
+DOC_SNAPSHOT_BUDGET = 64 * 1024 * 1024  # bytes comprimidos de pestañas inactivas antes de descartar
+
 SETTINGS_PATH = os.path.join(os.path.expanduser("~"), ".runpad_pro_settings.json")
+HISTORY_PATH  = os.path.join(os.path.expanduser("~"), ".runpad_pro_history.sqlite3")
+LOGS_DIR      = os.path.join(os.path.expanduser("~"), ".runpad_pro_logs")
+IMPORTS_PATH  = os.path.join(os.path.expanduser("~"), ".runpad_pro_imports.json")
+JOURNAL_DIR   = os.path.join(os.path.expanduser("~"), ".runpad_pro_journal")
+BATCH_PATH    = os.path.join(os.path.expanduser("~"), ".runpad_pro_batch.json")
 
 # ======== Seguridad ejecución ========
 ALLOWED_EXTS = (".py", ".pyw")
@@ -60,6 +80,1650 @@ def save_settings(s):
     except Exception:
         pass
 
+# ========= Operaciones de archivos en segundo plano =========
+class FileOpCancelled(Exception):
+    pass
+
+class FileOpJob:
+    def __init__(self, label, func, on_done):
+        self.label = label
+        self.func = func
+        self.on_done = on_done
+        self.cancel_event = threading.Event()
+        self.done = 0
+        self.total = 0
+
+    def check(self):
+        if self.cancel_event.is_set():
+            raise FileOpCancelled(f"{self.label}: cancelado")
+
+    def sleep(self, seconds):
+        # espera interrumpible por cancelación
+        if self.cancel_event.wait(seconds):
+            self.check()
+
+# Cola serie de renombrar/eliminar/copiar en un hilo de trabajo. `notify` recibe
+# callables que se ejecutan en el hilo de Tk: el worker nunca toca widgets.
+class FileOpsQueue:
+    PROGRESS_INTERVAL = 0.1
+
+    def __init__(self, notify, on_progress=None):
+        self._notify = notify
+        self._on_progress = on_progress
+        self._jobs = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending = []
+        self.current = None
+        self._last_progress = 0.0
+        threading.Thread(target=self._worker, daemon=True).start()
+
+    def submit(self, label, func, on_done=None):
+        job = FileOpJob(label, func, on_done)
+        with self._lock: self._pending.append(job)
+        self._jobs.put(job)
+        return job
+
+    def busy(self):
+        with self._lock: return self.current is not None or bool(self._pending)
+
+    def cancel(self, all_pending=False):
+        with self._lock:
+            jobs = ([self.current] if self.current else []) + (list(self._pending) if all_pending else [])
+        for j in jobs: j.cancel_event.set()
+        return len(jobs)
+
+    def progress(self, job, done, total):
+        job.done, job.total = done, total
+        now = time.monotonic()
+        if self._on_progress and (done >= total or now - self._last_progress >= self.PROGRESS_INTERVAL):
+            self._last_progress = now
+            cb = self._on_progress
+            self._notify(lambda: cb(job))
+
+    def _worker(self):
+        while True:
+            job = self._jobs.get()
+            with self._lock:
+                try: self._pending.remove(job)
+                except ValueError: pass
+                self.current = job
+            result, error = None, None
+            try:
+                job.check()
+                result = job.func(job)
+            except Exception as e:
+                error = e
+            with self._lock: self.current = None
+            if job.on_done:
+                cb = job.on_done
+                self._notify(lambda cb=cb, r=result, e=error: cb(r, e))
+
+def _retry_rename(old, new, job, attempts=6, delay=0.1):
+    # Windows suele retener carpetas unos instantes (antivirus, indexador, Explorador)
+    for i in range(attempts):
+        job.check()
+        try:
+            os.rename(old, new)
+            return new
+        except (PermissionError, OSError):
+            if i == attempts - 1: break
+            job.sleep(delay * (2 ** i))
+    raise PermissionError("El sistema mantiene la carpeta en uso.")
+
+def _rmtree_with_progress(path, job, queue_):
+    entries = []
+    for root, dirs, files in os.walk(path, topdown=False):
+        job.check()
+        entries.extend(os.path.join(root, f) for f in files)
+        entries.extend(os.path.join(root, d) for d in dirs)
+    entries.append(path)
+    total = len(entries)
+    for i, p in enumerate(entries, 1):
+        job.check()
+        try:
+            if os.path.isdir(p) and not os.path.islink(p): os.rmdir(p)
+            else: os.remove(p)
+        except PermissionError:
+            # archivos de solo lectura (Windows): quitar el atributo y reintentar
+            os.chmod(p, 0o700 if os.path.isdir(p) else 0o600)
+            if os.path.isdir(p) and not os.path.islink(p): os.rmdir(p)
+            else: os.remove(p)
+        queue_.progress(job, i, total)
+    return path
+
+def _copytree_with_progress(src, dst, job, queue_):
+    import shutil
+    files = []
+    for root, dirs, names in os.walk(src):
+        job.check()
+        rel = os.path.relpath(root, src)
+        os.makedirs(os.path.join(dst, rel), exist_ok=True)
+        files.extend(os.path.join(rel, n) for n in names)
+    total = len(files)
+    for i, rel in enumerate(files, 1):
+        job.check()
+        shutil.copy2(os.path.join(src, rel), os.path.join(dst, rel))
+        queue_.progress(job, i, total)
+    return dst
+
+# ========= Supervisión de procesos =========
+DEFAULT_LIMITS = {"timeout": 0, "cpu": 0, "mem_mb": 0}  # 0 = sin límite
+
+def _rlimit_preexec(limits):
+    cpu = int(limits.get("cpu") or 0)
+    mem = int(limits.get("mem_mb") or 0)
+    def apply():
+        # se ejecuta en el hijo, antes de exec
+        if cpu > 0: resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 5))
+        if mem > 0: resource.setrlimit(resource.RLIMIT_AS, (mem * 1024 * 1024,) * 2)
+    return apply
+
+def _describe_exit(code):
+    if code is not None and code < 0 and os.name != "nt":
+        try: return f"{code}, {signal.Signals(-code).name}"
+        except ValueError: pass
+    return str(code)
+
+# Cada ejecución arranca en su propio grupo de procesos/sesión, de modo que
+# detenerla alcanza también a los nietos (pools de multiprocessing, shell-outs).
+class ProcessSupervisor:
+    GRACE = 3.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._procs = []
+
+    def spawn(self, cmd, cwd, shell=False, limits=None, **kw):
+        limits = limits or {}
+        if os.name == "nt":
+            kw["creationflags"] = kw.get("creationflags", 0) | subprocess.CREATE_NEW_PROCESS_GROUP
+        else:
+            kw["start_new_session"] = True
+            if resource is not None and (limits.get("cpu") or limits.get("mem_mb")):
+                kw["preexec_fn"] = _rlimit_preexec(limits)
+        p = subprocess.Popen(cmd, cwd=cwd, shell=shell, **kw)
+        p.timed_out = False
+        p.exited = threading.Event()
+        with self._lock: self._procs.append(p)
+        timeout = float(limits.get("timeout") or 0)
+        if timeout > 0:
+            t = threading.Timer(timeout, self._on_timeout, args=(p,))
+            t.daemon = True; t.start()
+            p.watchdog = t
+        return p
+
+    def wait(self, p):
+        # único punto que espera al hijo; con wait4 obtenemos además su consumo de recursos
+        usage = None
+        if hasattr(os, "wait4"):
+            try:
+                _, status, ru = os.wait4(p.pid, 0)
+                p.returncode = os.waitstatus_to_exitcode(status)
+                rss = ru.ru_maxrss // 1024 if sys.platform == "darwin" else ru.ru_maxrss  # macOS: bytes
+                usage = {"cpu_user": ru.ru_utime, "cpu_sys": ru.ru_stime, "max_rss_kb": rss}
+            except ChildProcessError:
+                p.wait()
+        else:
+            p.wait()
+        p.exited.set()
+        return p.returncode, usage
+
+    def release(self, p):
+        t = getattr(p, "watchdog", None)
+        if t: t.cancel()
+        with self._lock:
+            try: self._procs.remove(p)
+            except ValueError: pass
+
+    def running(self):
+        with self._lock: return list(self._procs)
+
+    def _on_timeout(self, p):
+        if not p.exited.is_set():
+            p.timed_out = True
+            self.terminate(p)
+
+    def terminate(self, p, grace=None):
+        # SIGTERM al grupo → espera → SIGKILL al grupo; bloquea, llamar desde un hilo
+        grace = self.GRACE if grace is None else grace
+        if os.name == "nt":
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(p.pid)],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            if not p.exited.wait(grace): p.kill()
+            return
+        pgid = p.pid
+        try: os.killpg(pgid, signal.SIGTERM)
+        except (ProcessLookupError, PermissionError): pass
+        p.exited.wait(grace)
+        # el líder pudo salir dejando nietos vivos en el grupo
+        try: os.killpg(pgid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError): pass
+        p.exited.wait(grace)
+
+    def terminate_all(self, procs=None, grace=None):
+        procs = self.running() if procs is None else procs
+        threads = [threading.Thread(target=self.terminate, args=(p, grace), daemon=True) for p in procs]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        return len(procs)
+
+# ========= Historial de ejecuciones =========
+def _file_sha1(path):
+    try:
+        h = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""): h.update(chunk)
+        return h.hexdigest()
+    except OSError:
+        return None
+
+def _rolling_regressions(durations, pct, window=5):
+    import statistics
+    # [(mediana_previa | None, es_regresión)] para cada duración, en orden cronológico
+    out = []
+    for i, d in enumerate(durations):
+        prev = durations[max(0, i - window):i]
+        if len(prev) < 2:
+            out.append((None, False)); continue
+        med = statistics.median(prev)
+        out.append((med, med > 0 and d > med * (1 + pct / 100.0)))
+    return out
+
+class RunHistory:
+    FIELDS = ("script", "sha1", "started", "ended", "duration", "exit_code",
+              "cpu_user", "cpu_sys", "max_rss_kb", "log_path", "variant")
+
+    def __init__(self, path=HISTORY_PATH):
+        import sqlite3
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            try: self._db.execute("PRAGMA journal_mode=WAL")
+            except sqlite3.DatabaseError: pass
+            self._db.execute("""CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY, script TEXT NOT NULL, sha1 TEXT,
+                started REAL NOT NULL, ended REAL, duration REAL, exit_code INTEGER,
+                cpu_user REAL, cpu_sys REAL, max_rss_kb INTEGER, log_path TEXT, variant TEXT)""")
+            # variant: clave de la combinación de matriz (None = ejecución normal)
+            if "variant" not in {r[1] for r in self._db.execute("PRAGMA table_info(runs)")}:
+                self._db.execute("ALTER TABLE runs ADD COLUMN variant TEXT")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_runs_script_started ON runs(script, started)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_runs_started ON runs(started)")
+
+    def record(self, **run):
+        cols = [k for k in self.FIELDS if k in run]
+        sql = f"INSERT INTO runs ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})"
+        with self._lock, self._db:
+            return self._db.execute(sql, [run[k] for k in cols]).lastrowid
+
+    def scripts(self):
+        # → [(script, variante, ejecuciones, última)]; cada combinación de matriz es su propia serie
+        with self._lock:
+            return self._db.execute(
+                "SELECT script, variant, COUNT(*), MAX(started) FROM runs GROUP BY script, variant "
+                "ORDER BY MAX(started) DESC").fetchall()
+
+    def expected_durations(self, keys, window=5):
+        # (script, variante) → mediana de las últimas `window` ejecuciones correctas; None si no hay
+        # datos. Cada combinación de matriz tiene su propia historia.
+        import statistics
+        out = {}
+        with self._lock:
+            for sc, variant in keys:
+                rows = self._db.execute(
+                    "SELECT duration FROM runs WHERE script = ? AND variant IS ? AND exit_code = 0 "
+                    "AND duration IS NOT NULL ORDER BY started DESC LIMIT ?", (sc, variant, window)).fetchall()
+                out[(sc, variant)] = statistics.median(r[0] for r in rows) if rows else None
+        return out
+
+    def last_success(self, keys):
+        # (script, variante) → inicio de la última ejecución correcta de esa combinación
+        with self._lock:
+            return {(sc, v): (self._db.execute(
+                        "SELECT MAX(started) FROM runs WHERE script = ? AND variant IS ? AND exit_code = 0",
+                        (sc, v)).fetchone() or (None,))[0] for sc, v in keys}
+
+    def runs_for(self, script, variant=None, limit=200):
+        # las más recientes de una combinación, devueltas en orden cronológico
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT id, {', '.join(self.FIELDS)} FROM runs WHERE script = ? AND variant IS ? "
+                "ORDER BY started DESC LIMIT ?", (script, variant, limit)).fetchall()
+        keys = ("id",) + self.FIELDS
+        return [dict(zip(keys, r)) for r in reversed(rows)]
+
+# ========= Logs de ejecución (gzip por bloques + índice) =========
+LOG_BLOCK_BYTES = 64 * 1024   # texto por bloque comprimido
+LOG_BLOCK_SECS = 1.0          # o antes, si la salida llega despacio
+LOG_WINDOW_LINES = 2000       # líneas que se vuelcan a la consola al abrir un log
+LOG_SEARCH_MAX_HITS = 500
+
+# Cada bloque es un miembro gzip completo: `zcat` lee el archivo entero, y con el índice
+# "<desplazamiento> <bytes> <primera línea> <líneas> <t0> <t1>" (t relativos a la cabecera
+# "# <inicio>") se descomprime solo el bloque que contiene una línea o un instante.
+class RunLog:
+    live = {}                 # ruta → RunLog de las ejecuciones en curso
+    live_lock = threading.Lock()
+
+    def __init__(self, path):
+        self.name = path
+        self._f = open(path, "wb")
+        self._idx = open(path + ".idx", "w", encoding="ascii")
+        self._lock = threading.Lock()
+        self._buf = []; self._size = 0; self._lines = 0
+        self.started = time.time(); self._block_t = None
+        self._idx.write(f"# {self.started:.3f}\n"); self._idx.flush()
+        with RunLog.live_lock: RunLog.live[path] = self
+
+    def write(self, text):
+        if not text: return
+        now = time.time()
+        with self._lock:
+            if self._block_t is None: self._block_t = now
+            self._buf.append(text); self._size += len(text)
+            if self._size >= LOG_BLOCK_BYTES or now - self._block_t >= LOG_BLOCK_SECS: self._flush(now)
+
+    def _flush(self, now):
+        if not self._buf: return
+        data = "".join(self._buf).encode("utf-8", "replace")
+        co = zlib.compressobj(6, zlib.DEFLATED, 31)
+        comp = co.compress(data) + co.flush()
+        off = self._f.tell(); self._f.write(comp); self._f.flush()
+        n = data.count(b"\n")
+        self._idx.write(f"{off} {len(comp)} {self._lines} {n} "
+                        f"{self._block_t - self.started:.3f} {now - self.started:.3f}\n")
+        self._idx.flush()
+        self._buf = []; self._size = 0; self._lines += n; self._block_t = None
+
+    def pending(self):
+        # (primera línea, texto aún sin comprimir) para buscar en ejecuciones en curso
+        with self._lock:
+            return self._lines, "".join(self._buf)
+
+    def close(self):
+        with RunLog.live_lock: RunLog.live.pop(self.name, None)
+        try:
+            with self._lock: self._flush(time.time())
+        finally:
+            self._f.close(); self._idx.close()
+
+def _log_script_name(path):
+    # "20250101-120000-123_script.py.log.gz" → "script.py"
+    base = os.path.basename(path)
+    for ext in (".log.gz", ".log"):
+        if base.endswith(ext): base = base[:-len(ext)]; break
+    return base.split("_", 1)[1] if "_" in base else base
+
+def _log_blocks(path):
+    # → (inicio, [(desplazamiento, bytes, primera línea, líneas, t0, t1)]); los bloques
+    # que falten en el índice (cierre brusco) se recuperan recorriendo los miembros gzip
+    started, blocks = None, []
+    try:
+        with open(path + ".idx", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("#"):
+                    try: started = float(line[1:])
+                    except ValueError: pass
+                    continue
+                parts = line.split()
+                if len(parts) != 6: break   # última línea a medias
+                o, n, l, c = map(int, parts[:4]); blocks.append((o, n, l, c, float(parts[4]), float(parts[5])))
+    except (OSError, ValueError):
+        blocks = []
+    try: size = os.path.getsize(path)
+    except OSError: return started, blocks
+    pos = blocks[-1][0] + blocks[-1][1] if blocks else 0
+    if pos < size:
+        lines = blocks[-1][2] + blocks[-1][3] if blocks else 0
+        with open(path, "rb") as f:
+            f.seek(pos); data = f.read()
+        while data:
+            d = zlib.decompressobj(31)
+            try: out = d.decompress(data)
+            except zlib.error: break
+            if not d.eof: break              # bloque truncado
+            used = len(data) - len(d.unused_data)
+            n = out.count(b"\n")
+            blocks.append((pos, used, lines, n, None, None))
+            pos += used; lines += n; data = d.unused_data
+    return started, blocks
+
+def _list_run_logs(since=None):
+    # logs de LOGS_DIR (comprimidos y antiguos en texto plano), del más reciente al más antiguo
+    try:
+        found = [(e.stat().st_mtime, e.path) for e in os.scandir(LOGS_DIR) if e.name.endswith((".log.gz", ".log"))]
+    except OSError:
+        return []
+    return [p for mt, p in sorted(found, reverse=True) if since is None or mt >= since]
+
+def _log_chunks(path):
+    # bloques del índice + lo que una ejecución en curso aún no ha comprimido:
+    # → (inicio, [(bloque | None, primera línea, líneas, t0, texto | None)])
+    if not path.endswith(".gz"):   # logs anteriores, en texto plano: un solo trozo
+        with open(path, "r", encoding="utf-8", errors="replace") as f: text = f.read()
+        return os.path.getmtime(path), [(None, 0, text.count("\n"), None, text)]
+    started, blocks = _log_blocks(path)
+    chunks = [(b, b[2], b[3], b[4], None) for b in blocks]
+    with RunLog.live_lock: live = RunLog.live.get(path)
+    if live:
+        first, tail = live.pending()
+        if tail: chunks.append((None, first, tail.count("\n"), None, tail))
+    return started, chunks
+
+def _chunk_text(f, chunk):
+    if chunk[4] is not None: return chunk[4]
+    f.seek(chunk[0][0])
+    return zlib.decompress(f.read(chunk[0][1]), 31).decode("utf-8", "replace")
+
+def _read_log_window(path, line=None, size=LOG_WINDOW_LINES):
+    # → (nº de la primera línea, [líneas], total de líneas); sin `line`, el final del log.
+    # Solo se descomprimen los bloques que tocan la ventana.
+    _started, chunks = _log_chunks(path)
+    if not chunks: return 1, [], 0
+    with open(path, "rb") as f:
+        # el último bloque dice si la última línea está terminada
+        last = _chunk_text(f, chunks[-1])
+        total = chunks[-1][1] + chunks[-1][2] + (0 if last.endswith("\n") else 1)
+        lo = max(0, min(total - size, line - 1 - size // 2) if line else total - size)
+        hi = min(total, lo + size)
+        chosen = [c for c in chunks if c[1] < hi and c[1] + c[2] >= lo]
+        lines = "".join(last if c is chunks[-1] else _chunk_text(f, c) for c in chosen).split("\n")
+    base = chosen[0][1]
+    return lo + 1, lines[lo - base:hi - base], total
+
+def _plain_literal(pattern):
+    # patrón sin metacaracteres: se busca en los bytes y solo se decodifican los bloques que lo contienen
+    return pattern if pattern and not re.search(r"[.^$*+?{}\[\]\\|()]", pattern) else None
+
+def _tail_from(buf, lines, nl="\n"):
+    # índice donde empiezan las `lines` últimas líneas completas más la línea sin terminar
+    k = len(buf)
+    for _ in range(lines + 1):
+        k = buf.rfind(nl, 0, k)
+        if k == -1: return 0
+    return k + 1
+
+def _search_log(path, rx, literal=None, context=2, max_hits=LOG_SEARCH_MAX_HITS, cancelled=lambda: False):
+    # genera (nº de línea, instante aproximado | None, [(nº, texto)] de contexto); un acierto por línea.
+    # El instante es el del bloque: preciso a LOG_BLOCK_SECS.
+    started, chunks = _log_chunks(path)
+    needle = literal.encode("utf-8") if literal else None
+    carry, start = "", 0      # últimas líneas ya vistas (contexto) + la línea sin terminar; `start`: su nº
+    hits, last = 0, -1
+    with open(path, "rb") as f:
+        for n, c in enumerate(chunks):
+            if cancelled(): return
+            final = n == len(chunks) - 1
+            if needle is not None and c[4] is None:
+                f.seek(c[0][0]); data = zlib.decompress(f.read(c[0][1]), 31)
+                if needle not in data and literal not in carry \
+                        and needle not in carry[-len(literal):].encode("utf-8", "replace") + data[:len(needle)]:
+                    k = _tail_from(data, context, b"\n")
+                    if k: carry, start = data[k:].decode("utf-8", "replace"), c[1] + data.count(b"\n", 0, k)
+                    else: carry += data.decode("utf-8", "replace")
+                    continue
+                text = data.decode("utf-8", "replace")
+            else:
+                text = _chunk_text(f, c)
+            buf = carry + text
+            # solo líneas completas: la última puede seguir en el bloque siguiente
+            end = len(buf) if final else buf.rfind("\n") + 1
+            pos, cur = 0, start
+            for m in rx.finditer(buf, 0, end):
+                cur += buf.count("\n", pos, m.start()); pos = m.start()
+                if cur <= last: continue
+                last = cur
+                s = _tail_from(buf[:buf.rfind("\n", 0, m.start()) + 1], context)
+                e = m.end()
+                for _ in range(context + 1):
+                    e = buf.find("\n", e, end) + 1
+                    if e == 0: e = end; break
+                k = buf.count("\n", s, m.start())
+                yield cur + 1, started + c[3] if started and c[3] is not None else None, [(cur - k + 1 + i, l) for i, l in enumerate(buf[s:e].rstrip("\n").split("\n"))]
+                hits += 1
+                if hits >= max_hits or cancelled(): return
+            k = _tail_from(buf[:end], context) if end else 0
+            if k: carry, start = buf[k:], start + buf.count("\n", 0, k)
+            else: carry = buf
+            if len(carry) > 1 << 20:   # línea enorme sin saltos: se conserva el final
+                start += carry.count("\n", 0, len(carry) - (1 << 20)); carry = carry[-(1 << 20):]
+
+# ========= Planificación de lotes =========
+def _fmt_secs(secs):
+    secs = int(round(secs))
+    if secs >= 3600: return f"{secs // 3600}h {secs % 3600 // 60:02d}m"
+    if secs >= 60: return f"{secs // 60}m {secs % 60:02d}s"
+    return f"{secs}s"
+
+def _lpt_order(jobs):
+    # longest-processing-time primero; los desconocidos van delante (podrían ser largos)
+    return sorted(jobs, key=lambda j: (j["expected"] is not None, -(j["expected"] or 0.0)))
+
+def _estimate_makespan(remaining_running, queued, slots):
+    free = sorted(remaining_running)[:slots]
+    free += [0.0] * (slots - len(free))
+    heapq.heapify(free)
+    end = max(free) if free else 0.0
+    for d in queued:
+        t = heapq.heappop(free) + d
+        end = max(end, t); heapq.heappush(free, t)
+    return end
+
+BATCH_JOB_FIELDS = ("label", "cmd", "cwd", "limits", "env", "matrix", "display")
+
+def _load_batch_checkpoint(path=BATCH_PATH):
+    try:
+        with open(path, "r", encoding="utf-8") as f: return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _resume_plan(ckpt, source_hash=_file_sha1):
+    # → (trabajos a repetir, entradas correctas que se conservan, scripts que ya no existen,
+    # correctos que se repiten porque su script o sus importaciones locales cambiaron)
+    rerun, keep, missing, sha, changed = [], [], [], {}, 0
+    for e in ckpt.get("jobs", []):
+        label = e["job"]["label"]
+        if label not in sha: sha[label] = source_hash(label)
+        if sha[label] is None:
+            if label not in missing: missing.append(label)
+        elif e.get("state") == "ok" and e.get("sha1") == sha[label]:
+            keep.append(e)
+        else:
+            changed += e.get("state") == "ok"
+            rerun.append(dict(e["job"], expected=None))
+    return rerun, keep, missing, changed
+
+class BatchRun:
+    def __init__(self, jobs, concurrency, checkpoint=None, carried=(), source_hash=_file_sha1):
+        self.jobs = _lpt_order(jobs)
+        self.concurrency = max(1, int(concurrency))
+        self.local_concurrency = self.concurrency   # la de la configuración, sin slots de agentes
+        self.results = []        # (job, code, duración)
+        self.running = {}        # id(job) -> inicio (monotonic)
+        self.stop = threading.Event()
+        self.lock = threading.Lock()
+        self.t0 = time.monotonic()
+        self.started = time.time()
+        self.cancelled = set()   # id(job) de los que terminaron mal por una detención
+        self.checkpoint = checkpoint      # ruta del punto de control o None
+        self.carried = list(carried)      # entradas correctas de la ejecución que se reanuda
+        self.source_hash = source_hash    # ruta → hash del código que se ejecuta
+        self._save_lock = threading.Lock()
+
+    def mark_started(self, job):
+        job["sha1"] = self.source_hash(job["label"])   # el código que de verdad se ejecuta
+        with self.lock: self.running[id(job)] = time.monotonic()
+
+    def finish(self, job, code, duration):
+        with self.lock:
+            self.running.pop(id(job), None)
+            self.results.append((job, code, duration))
+            if code != 0 and self.stop.is_set(): self.cancelled.add(id(job))
+        self.save()
+
+    def save(self):
+        # punto de control tras cada trabajo: los que no llegaron a terminar quedan "pending"
+        if not self.checkpoint: return
+        with self._save_lock:
+            with self.lock:
+                codes = {id(j): c for j, c, _ in self.results}
+                entries = list(self.carried)
+                for j in self.jobs:
+                    if id(j) not in codes: state = "pending"
+                    elif codes[id(j)] == 0: state = "ok"
+                    elif id(j) in self.cancelled: state = "cancelled"
+                    else: state = "failed"
+                    entries.append({"job": {k: j[k] for k in BATCH_JOB_FIELDS if j.get(k) is not None},
+                                    "state": state, "code": codes.get(id(j)), "sha1": j.get("sha1")})
+            doc = {"started": self.started, "concurrency": self.local_concurrency, "jobs": entries}
+            tmp = self.checkpoint + ".tmp"
+            try:
+                with open(tmp, "w", encoding="utf-8") as f: json.dump(doc, f)
+                os.replace(tmp, self.checkpoint)
+            except OSError:
+                pass
+
+    def _fallback(self):
+        import statistics
+        known = [j["expected"] for j in self.jobs if j["expected"]]
+        known += [d for _, c, d in self.results if c == 0]
+        return statistics.median(known) if known else None
+
+    def eta(self):
+        with self.lock:
+            now = time.monotonic()
+            fb = self._fallback()
+            done = {id(j) for j, _, _ in self.results}
+            running, queued = [], []
+            for j in self.jobs:
+                exp = j["expected"] if j["expected"] is not None else fb
+                if id(j) in done: continue
+                if exp is None: return None
+                if id(j) in self.running: running.append(max(0.0, exp - (now - self.running[id(j)])))
+                else: queued.append(exp)
+            return _estimate_makespan(running, queued, self.concurrency)
+
+    def summary(self):
+        name = lambda j: (j.get("display") or os.path.basename(j["label"])) + (f" @{j['agent']}" if j.get("agent") else "")
+        singles = [(j, c) for j, c, _ in self.results if not j.get("matrix")]
+        ok = [name(j) for j, c in singles if c == 0]
+        fail = [name(j) for j, c in singles if c not in (0, None)]
+        skipped = [name(j) for j, c in singles if c is None]
+        groups = {}
+        for j, c, _ in self.results:
+            if j.get("matrix"): groups.setdefault(j["label"], []).append((j, c))
+        out = "\n== Resumen de ejecución ==\n"
+        if singles or not groups:
+            out += f"OK ({len(ok)}): " + (", ".join(ok) if ok else "ninguno") + "\n"
+            out += f"FALLÓ ({len(fail)}): " + (", ".join(fail) if fail else "ninguno") + "\n"
+        if skipped: out += f"NO INICIADOS ({len(skipped)}): " + ", ".join(skipped) + "\n"
+        if self.carried:
+            out += f"YA CORRECTOS, omitidos ({len(self.carried)}): " + \
+                   ", ".join(e["job"].get("display") or os.path.basename(e["job"]["label"]) for e in self.carried) + "\n"
+        for label, items in groups.items():
+            n_ok = sum(1 for _, c in items if c == 0)
+            out += f"Matriz {os.path.basename(label)}: {n_ok}/{len(items)} OK\n"
+            for j, c in items:
+                if c != 0:
+                    state = "NO INICIADO" if c is None else f"FALLÓ ({_describe_exit(c)})"
+                    out += f"  - [{state}] {j['matrix']}\n"
+        remote = {}
+        for j, _, _ in self.results:
+            if j.get("agent"): remote[j["agent"]] = remote.get(j["agent"], 0) + 1
+        if remote:
+            out += f"En agentes ({sum(remote.values())}): " + ", ".join(f"{a} ×{n}" for a, n in remote.items()) + "\n"
+        out += f"Tiempo total: {_fmt_secs(time.monotonic() - self.t0)}\n"
+        return out
+
+# ========= Matriz de parámetros =========
+def _expand_matrix(path, spec):
+    import glob
+    # producto cartesiano argv × entorno × archivos de entrada → [{"argv", "env", "key"}]
+    arg_sets = [list(a) for a in spec.get("args") or []] or [[]]
+    env = spec.get("env") or {}
+    env_keys = sorted(env)
+    env_sets = [dict(zip(env_keys, vals)) for vals in itertools.product(*(env[k] for k in env_keys))]
+    pattern = (spec.get("glob") or "").strip()
+    base = os.path.dirname(path)
+    files = [None]
+    if pattern:
+        full = pattern if os.path.isabs(pattern) else os.path.join(base, pattern)
+        files = [os.path.relpath(f, base) for f in sorted(glob.glob(full)) if os.path.isfile(f)]
+    combos = []
+    for argv, env_vals, f in itertools.product(arg_sets, env_sets, files):
+        argv = argv + ([f] if f else [])
+        parts = [" ".join(argv)] if argv else []
+        parts += [f"{k}={v}" for k, v in env_vals.items()]
+        combos.append({"argv": argv, "env": env_vals, "key": " | ".join(parts) or "(sin parámetros)"})
+    return combos
+
+# ========= Kernel (intérprete persistente) =========
+KERNEL_SENTINEL = "\x1eRUNPAD-KERNEL-LISTO\x1e"
+# Protocolo por stdin: "<bytes> <nombre>\n<código>". Tras cada envío el hijo escribe
+# el centinela en su propia línea; las variables viven en `ns` entre envíos.
+KERNEL_SRC = r'''
+import ast, io, os, signal, sys, traceback
+SENTINEL = os.environ["RUNPAD_KERNEL_SENTINEL"]
+proto = sys.stdin.buffer
+sys.stdin = io.StringIO()
+def interruptible(on):
+    # mientras se lee un marco las interrupciones se ignoran: un KeyboardInterrupt a medio
+    # proto.read() perdería bytes y desincronizaría el flujo
+    handler = signal.default_int_handler if on else signal.SIG_IGN
+    signal.signal(signal.SIGINT, handler)
+    if hasattr(signal, "SIGBREAK"): signal.signal(signal.SIGBREAK, handler)
+ns = {"__name__": "__main__", "__builtins__": __builtins__}
+if os.environ.get("RUNPAD_KERNEL_FILE"): ns["__file__"] = os.environ["RUNPAD_KERNEL_FILE"]
+sys.path.insert(0, os.getcwd())
+
+def run(src, name):
+    tree = ast.parse(src, name, "exec")
+    last = None
+    if tree.body and isinstance(tree.body[-1], ast.Expr):
+        last = ast.Expression(tree.body.pop().value)
+    exec(compile(tree, name, "exec"), ns)
+    if last is not None:
+        value = eval(compile(last, name, "eval"), ns)
+        if value is not None:
+            ns["_"] = value
+            print(repr(value))
+
+interruptible(False)
+while True:
+    header = proto.readline()
+    if not header: break
+    size, _, name = header.decode("utf-8").rstrip("\r\n").partition(" ")
+    src = proto.read(int(size)).decode("utf-8")
+    try:
+        interruptible(True)
+        run(src, name or "<kernel>")
+    except SystemExit as e:
+        print(f"[SystemExit: {e.code}]")
+    except BaseException:
+        et, ev, tb = sys.exc_info()
+        while tb is not None and tb.tb_frame.f_code.co_filename == "<string>": tb = tb.tb_next
+        traceback.print_exception(et, ev, tb)
+    finally:
+        interruptible(False)
+        sys.stdout.flush(); sys.stderr.flush()
+        sys.stdout.write("\n" + SENTINEL + "\n"); sys.stdout.flush()
+'''
+
+# ========= Agentes remotos =========
+# Protocolo: líneas JSON sobre TCP. El agente saluda con un nonce; el cliente responde con
+# HMAC-SHA256(token, nonce + trabajo en JSON canónico) y, opcionalmente, el trabajo. El agente
+# confirma {"started"} al lanzar el proceso, emite {"out"} por cada trozo de salida y termina
+# con {"exit"}; si el cliente cierra la conexión, mata el proceso.
+AGENT_PORT = 8765
+AGENT_PYTHON = "{python}"   # en argv: el intérprete del agente, no el del cliente
+
+def _agent_mac(token, nonce, job=None):
+    # el trabajo va firmado: sin esto, quien esté en medio podría cambiar argv/cwd/env
+    import hmac
+    msg = nonce + "\n" + json.dumps(job, sort_keys=True, separators=(",", ":"))
+    return hmac.new(token.encode("utf-8"), msg.encode("utf-8"), hashlib.sha256).hexdigest()
+
+def _agent_send(f, obj):
+    f.write((json.dumps(obj) + "\n").encode("utf-8")); f.flush()
+
+def _agent_recv(f):
+    line = f.readline()
+    if not line: raise ConnectionError("conexión cerrada por el otro extremo")
+    return json.loads(line)
+
+class WorkerAgent:
+    def __init__(self, token, slots):
+        self.token = token
+        self.slots = max(1, int(slots))
+        self.busy = 0
+        self.lock = threading.Lock()
+        self.supervisor = ProcessSupervisor()
+
+    def free(self):
+        with self.lock: return self.slots - self.busy
+
+    def serve(self, host, port):
+        import socket
+        srv = socket.create_server((host, port))
+        print(f"Agente RunPad en {host or '*'}:{port} · {self.slots} slot(s)", flush=True)
+        try:
+            while True:
+                conn, addr = srv.accept()
+                threading.Thread(target=self._handle, args=(conn, addr), daemon=True).start()
+        finally:
+            srv.close(); self.supervisor.terminate_all(grace=1.0)
+
+    def _handle(self, conn, addr):
+        import socket, hmac
+        with conn, conn.makefile("rwb") as f:
+            try:
+                nonce = os.urandom(16).hex()
+                _agent_send(f, {"hello": "runpad-agent", "version": 2, "nonce": nonce, "host": socket.gethostname(),
+                                "slots": self.slots, "free": self.free()})
+                conn.settimeout(30)
+                msg = _agent_recv(f)
+                job = msg.get("job")
+                if not hmac.compare_digest(str(msg.get("auth", "")), _agent_mac(self.token, nonce, job)):
+                    _agent_send(f, {"error": "autenticación fallida"}); return
+                if job is None:
+                    _agent_send(f, {"ok": True, "free": self.free()}); return
+                with self.lock:
+                    if self.busy >= self.slots:
+                        _agent_send(f, {"busy": True}); return
+                    self.busy += 1
+                conn.settimeout(None)
+                try: self._run(job, conn, f)
+                finally:
+                    with self.lock: self.busy -= 1
+            except (OSError, ValueError, ConnectionError):
+                pass
+
+    def _run(self, job, conn, f):
+        cwd = job.get("cwd") or os.getcwd()
+        if not os.path.isdir(cwd):
+            _agent_send(f, {"error": f"el directorio no existe en el agente: {cwd}"}); return
+        argv = [sys.executable if a == AGENT_PYTHON else a for a in job["argv"]]
+        env = dict(os.environ, **job["env"]) if job.get("env") else None
+        try:
+            p = self.supervisor.spawn(argv, cwd, limits=job.get("limits"), env=env,
+                                      stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        except Exception as e:
+            _agent_send(f, {"error": str(e)}); return
+        sys.stdout.write(f"[{time.strftime('%H:%M:%S')}] {' '.join(argv)}  ({cwd})\n"); sys.stdout.flush()
+        try:
+            # a partir de aquí el cliente no debe repetir el trabajo en otro sitio
+            _agent_send(f, {"started": True})
+        except OSError:
+            self.supervisor.terminate(p, 1.0); self.supervisor.release(p); return
+
+        def watch_client():
+            # el cliente no envía nada más: recv() vuelve solo si cierra o cancela
+            try: conn.recv(1)
+            except OSError: pass
+            if p.poll() is None: self.supervisor.terminate(p, 1.0)
+        threading.Thread(target=watch_client, daemon=True).start()
+        try:
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            read = getattr(p.stdout, "read1", p.stdout.read)
+            while True:
+                data = read(65536)
+                text = decoder.decode(data, final=not data)
+                if text: _agent_send(f, {"out": text})
+                if not data: break
+            code, usage = self.supervisor.wait(p)
+            _agent_send(f, {"exit": code, "timed_out": p.timed_out, "usage": usage})
+        except OSError:
+            self.supervisor.terminate(p, 1.0)
+        finally:
+            self.supervisor.release(p)
+
+class AgentClient:
+    def __init__(self, host, port=AGENT_PORT, token=""):
+        self.host, self.port = host, int(port)
+        self.token = token or os.environ.get("RUNPAD_AGENT_TOKEN", "")
+        self.label = f"{host}:{self.port}"
+
+    def _connect(self, timeout):
+        import socket
+        sock = socket.create_connection((self.host, self.port), timeout=timeout)
+        f = sock.makefile("rwb")
+        hello = _agent_recv(f)
+        if hello.get("hello") != "runpad-agent":
+            sock.close(); raise ConnectionError(f"{self.label} no es un agente RunPad")
+        return sock, f, hello
+
+    def probe(self, timeout=3.0):
+        # → saludo del agente (host, slots, free); lanza si no responde o el token no vale
+        sock, f, hello = self._connect(timeout)
+        with sock, f:
+            _agent_send(f, {"auth": _agent_mac(self.token, hello["nonce"])})
+            reply = _agent_recv(f)
+        if "error" in reply: raise PermissionError(f"{self.label}: {reply['error']}")
+        hello["free"] = reply.get("free", hello.get("free"))
+        return hello
+
+    def run(self, job, on_connect=None, timeout=5.0):
+        # generador de mensajes del agente: {"started"}, {"out"}…, y {"exit"} / {"error"} / {"busy"}
+        sock, f, hello = self._connect(timeout)
+        with sock, f:
+            sock.settimeout(None)
+            if on_connect: on_connect(sock)
+            _agent_send(f, {"auth": _agent_mac(self.token, hello["nonce"], job), "job": job})
+            while True:
+                msg = _agent_recv(f)
+                yield msg
+                if "out" not in msg and "started" not in msg: return
+
+def _agent_main(argv):
+    import argparse
+    ap = argparse.ArgumentParser(prog="runpad-pro.py --agent",
+                                 description="Agente remoto para lotes del automatizador de RunPad Pro+")
+    ap.add_argument("--agent", action="store_true")
+    ap.add_argument("--host", default="0.0.0.0")
+    ap.add_argument("--port", type=int, default=AGENT_PORT)
+    ap.add_argument("--slots", type=int, default=os.cpu_count() or 4)
+    ap.add_argument("--token", default=os.environ.get("RUNPAD_AGENT_TOKEN"),
+                    help="secreto compartido (o variable RUNPAD_AGENT_TOKEN)")
+    args = ap.parse_args(argv)
+    if not args.token: ap.error("falta --token o RUNPAD_AGENT_TOKEN")
+    try:
+        WorkerAgent(args.token, args.slots).serve(args.host, args.port)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+# ========= Verificación previa (preflight) =========
+PREFLIGHT_POOL_MIN = 8  # con menos archivos no compensa arrancar procesos
+
+def _module_files(parts, root):
+    # archivos locales que importa "a.b.c" buscando desde root (paquetes intermedios incluidos)
+    out = []
+    for i in range(1, len(parts) + 1):
+        stem = os.path.join(root, *parts[:i])
+        if os.path.isfile(stem + ".py"):
+            out.append(stem + ".py"); break
+        init = os.path.join(stem, "__init__.py")
+        if os.path.isfile(init): out.append(init)
+        elif not os.path.isdir(stem): break
+    return out
+
+def _local_imports(path, tree, root_dir):
+    found = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for a in node.names: found += _module_files(a.name.split("."), root_dir)
+        elif isinstance(node, ast.ImportFrom):
+            base = root_dir
+            if node.level:
+                base = os.path.dirname(path)
+                for _ in range(node.level - 1): base = os.path.dirname(base)
+            parts = node.module.split(".") if node.module else []
+            if parts: found += _module_files(parts, base)
+            for a in node.names:
+                if a.name != "*": found += _module_files(parts + [a.name], base)
+    return list(dict.fromkeys(os.path.abspath(f) for f in found if os.path.abspath(f) != path))
+
+def _pyc_is_fresh(path):
+    try:
+        st = os.stat(path)
+        with open(importlib.util.cache_from_source(path), "rb") as f: head = f.read(16)
+    except (OSError, ValueError):
+        return False
+    return (len(head) == 16 and head[:4] == importlib.util.MAGIC_NUMBER and head[4:8] == b"\0\0\0\0"
+            and int.from_bytes(head[8:12], "little") == int(st.st_mtime) & 0xFFFFFFFF
+            and int.from_bytes(head[12:16], "little") == st.st_size & 0xFFFFFFFF)
+
+def _preflight_check(path, root_dir):
+    import py_compile
+    # → (path, error | None, dependencias locales); error = (línea, columna, mensaje)
+    try:
+        with open(path, "rb") as f: src = f.read()
+        tree = ast.parse(src, path)
+    except SyntaxError as e:
+        return path, (e.lineno or 1, e.offset or 0, e.msg), []
+    except (OSError, ValueError) as e:
+        return path, (1, 0, str(e)), []
+    if not _pyc_is_fresh(path):
+        try:
+            py_compile.compile(path, doraise=True)
+        except py_compile.PyCompileError as e:
+            err = e.exc_value
+            return path, (getattr(err, "lineno", None) or 1, getattr(err, "offset", None) or 0, e.msg), []
+        except OSError:
+            pass  # __pycache__ no escribible: la sintaxis ya está validada
+    return path, None, _local_imports(path, tree, root_dir)
+
+def _preflight_batch(roots, workers=None):
+    import multiprocessing
+    from concurrent import futures
+    # compila scripts + importaciones locales (transitivas) en paralelo; → [(path, línea, col, msg)]
+    def run(submit):
+        seen, errors, pending = set(), [], set()
+        def add(path, root_dir):
+            if path not in seen:
+                seen.add(path); pending.add(submit(path, root_dir))
+        for r in roots: add(os.path.abspath(r), os.path.dirname(os.path.abspath(r)))
+        while pending:
+            done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+            for fut in done:
+                pending.discard(fut)
+                path, err, deps = fut.result()
+                if err: errors.append((path,) + err)
+                for d in deps: add(d, fut.root_dir)
+        return sorted(errors), len(seen)
+
+    def inline(path, root_dir):
+        fut = futures.Future(); fut.set_result(_preflight_check(path, root_dir)); fut.root_dir = root_dir
+        return fut
+    if len(roots) < PREFLIGHT_POOL_MIN:
+        return run(inline)
+    try:
+        with futures.ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as ex:
+            def pooled(path, root_dir):
+                fut = ex.submit(_preflight_check, path, root_dir); fut.root_dir = root_dir
+                return fut
+            return run(pooled)
+    except Exception:
+        # sin procesos (módulo no importable por los hijos, entorno congelado…): en serie
+        return run(inline)
+
+# ========= Grafo de importaciones =========
+# Dependencias locales directas por archivo, cacheadas en disco y revalidadas por mtime.
+# Las importaciones absolutas se resuelven contra la carpeta del script raíz (sys.path[0]).
+class ImportGraph:
+    def __init__(self, path=IMPORTS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._entries = None  # se lee del disco en el primer uso
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f: self._entries = json.load(f)
+            except Exception:
+                self._entries = {}
+
+    def deps(self, path, root_dir):
+        try: mtime = os.stat(path).st_mtime_ns
+        except OSError: return []
+        with self._lock:
+            self._load()
+            entry = self._entries.get(path)
+            if entry is None or entry.get("mtime") != mtime:
+                entry = self._entries[path] = {"mtime": mtime, "roots": {}}
+            cached = entry["roots"].get(root_dir)
+        if cached is not None: return cached
+        try:
+            with open(path, "rb") as f: tree = ast.parse(f.read(), path)
+            found = _local_imports(path, tree, root_dir)
+        except (SyntaxError, ValueError, OSError):
+            found = []
+        with self._lock:
+            entry["roots"][root_dir] = found; self._dirty = True
+        return found
+
+    def closure(self, script):
+        script = os.path.abspath(script)
+        root_dir = os.path.dirname(script)
+        seen, stack = {script}, [script]
+        while stack:
+            for d in self.deps(stack.pop(), root_dir):
+                if d not in seen: seen.add(d); stack.append(d)
+        return seen
+
+    def save(self):
+        with self._lock:
+            if not self._dirty: return
+            self._entries = {p: e for p, e in self._entries.items() if os.path.exists(p)}
+            data = json.dumps(self._entries); self._dirty = False
+        try:
+            with open(self.path, "w", encoding="utf-8") as f: f.write(data)
+        except Exception:
+            pass
+
+def _closure_sha1(graph, script):
+    # hash del script y sus importaciones locales; sin importaciones, el SHA-1 del propio script
+    script = os.path.abspath(script)
+    own = _file_sha1(script)
+    files = sorted(graph.closure(script))
+    if own is None or len(files) == 1: return own
+    h = hashlib.sha1()
+    for f in files: h.update(f"{f}\0{_file_sha1(f) or '-'}\n".encode("utf-8", "surrogatepass"))
+    return h.hexdigest()
+
+def _changed_since(files, since):
+    # archivos modificados después de `since` (epoch); sin referencia, todos cuentan como cambiados
+    changed = []
+    for f in sorted(files):
+        try: m = os.stat(f).st_mtime
+        except OSError: continue
+        if since is None or m > since: changed.append(f)
+    return changed
+
+# ========= Verificación en segundo plano (lint) =========
+LINT_MAX_LINE = 120
+LINT_REGION_MIN = 20   # líneas mínimas por región cacheada
+
+def _lint_lines(lines, first):
+    out = []
+    for i, line in enumerate(lines):
+        n = first + i
+        stripped = line.rstrip()
+        if stripped != line and stripped:
+            out.append([n, len(stripped), len(line), "warn", "Espacios al final de la línea"])
+        indent = line[:len(line) - len(line.lstrip())]
+        if "\t" in indent:
+            out.append([n, 0, len(indent), "warn", "Tabulador en la sangría"])
+        if len(line) > LINT_MAX_LINE:
+            out.append([n, LINT_MAX_LINE, len(line), "warn", f"Línea de {len(line)} caracteres (> {LINT_MAX_LINE})"])
+    return out
+
+def _char_col(lines, lineno, col):
+    # col_offset de ast cuenta bytes UTF-8; Tk cuenta caracteres ("año" antes del nodo)
+    line = lines[lineno - 1] if 0 < lineno <= len(lines) else ""
+    return col if line.isascii() else len(line.encode("utf-8", "surrogatepass")[:col].decode("utf-8", "replace"))
+
+def _ast_facts(tree, lines):
+    # (diagnósticos, importaciones de nivel superior, nombres usados, hay import *)
+    diags, imported, used, star = [], {}, set(), False
+    col = lambda node: _char_col(lines, node.lineno, node.col_offset)
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            if isinstance(node, ast.ImportFrom) and node.module == "__future__": continue
+            for a in node.names:
+                if a.name == "*": star = True; continue
+                name = a.asname or a.name.split(".")[0]
+                imported.setdefault(name, (node.lineno, col(node), a.name))
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            used.add(node.id)
+        elif isinstance(node, ast.Constant) and isinstance(node.value, str):
+            used.add(node.value)  # __all__ y anotaciones en texto
+        elif isinstance(node, ast.ExceptHandler) and node.type is None:
+            diags.append([node.lineno, col(node), None, "warn", "'except:' sin tipo captura también KeyboardInterrupt"])
+        elif isinstance(node, ast.Compare):
+            for op, right in zip(node.ops, node.comparators):
+                if isinstance(op, (ast.Eq, ast.NotEq)) and isinstance(right, ast.Constant) and right.value is None:
+                    diags.append([node.lineno, col(node), None, "warn", "Compara con None usando 'is' / 'is not'"])
+    return diags, imported, used, star
+
+def _unused_imports(imported, used, star):
+    if star: return []
+    return [[line, col, None, "warn", f"'{full}' importado pero no usado"]
+            for name, (line, col, full) in imported.items() if name not in used]
+
+LINT_CONT = ("else", "elif", "except", "finally", ")", "]", "}")
+
+def _split_regions(lines):
+    # cortes en sentencias de nivel superior; cada región se analiza y cachea por separado
+    bounds, start, prev = [], 0, ""
+    for i, l in enumerate(lines):
+        if (i - start >= LINT_REGION_MIN and l[:1].strip() and l[0] != "#" and not l.startswith(LINT_CONT)
+                and not prev.startswith("@") and not prev.rstrip().endswith("\\")):
+            bounds.append((start, i)); start = i
+        if l.strip(): prev = l
+    bounds.append((start, len(lines)))
+    return bounds
+
+def _lint_region(text):
+    entry = {"lines": _lint_lines(text.split("\n"), 1), "ok": False}
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError, RecursionError):
+        return entry  # puede ser un corte en mal sitio: lo decide el análisis completo
+    entry["ok"] = True
+    entry["diags"], entry["imported"], entry["used"], entry["star"] = _ast_facts(tree, text.split("\n"))
+    return entry
+
+def _lint_full(text, cache):
+    key = "full:" + hashlib.sha1(text.encode("utf-8", "surrogatepass")).hexdigest()
+    diags = cache.get(key)
+    if diags is None:
+        try:
+            d, imported, used, star = _ast_facts(ast.parse(text), text.split("\n"))
+            diags = d + _unused_imports(imported, used, star)
+        except SyntaxError as e:
+            diags = [[e.lineno or 1, max(0, (e.offset or 1) - 1), None, "error", f"Error de sintaxis: {e.msg}"]]
+        except (ValueError, RecursionError) as e:
+            diags = [[1, 0, None, "error", str(e)]]
+        cache.pop(cache.get("full:last"), None)
+        cache[key] = diags; cache["full:last"] = key
+    return list(diags)
+
+def _lint_text(text, cache):
+    # diagnósticos [línea, col, col_fin | None, "error" | "warn", mensaje]; `cache` se reutiliza entre llamadas
+    lines = text.split("\n")
+    regions = []
+    for a, b in _split_regions(lines):
+        chunk = "\n".join(lines[a:b])
+        key = hashlib.sha1(chunk.encode("utf-8", "surrogatepass")).digest()
+        entry = cache.get(key)
+        if entry is None: entry = cache[key] = _lint_region(chunk)
+        regions.append((a, entry))
+    diags = []
+    for a, entry in regions:
+        diags.extend([d[0] + a] + d[1:] for d in entry["lines"])
+    if all(entry["ok"] for _, entry in regions):
+        imported, used, star = {}, set(), False
+        for a, entry in regions:
+            diags.extend([d[0] + a] + d[1:] for d in entry["diags"])
+            for name, (line, col, full) in entry["imported"].items():
+                imported.setdefault(name, (line + a, col, full))
+            used |= entry["used"]; star = star or entry["star"]
+        diags.extend(_unused_imports(imported, used, star))
+    else:
+        diags.extend(_lint_full(text, cache))
+    if len(cache) > 20000:
+        keep = cache.get("full:last")
+        saved = {k: cache[k] for k in (keep, "full:last") if k in cache}
+        cache.clear(); cache.update(saved)
+    diags.sort(key=lambda d: (d[0], d[1]))
+    return diags
+
+def _lint_server():
+    # bucle del proceso de verificación: "<bytes>\n<texto>" → una línea JSON
+    cache = {}
+    inp = sys.stdin.buffer
+    while True:
+        header = inp.readline()
+        if not header: return
+        text = inp.read(int(header)).decode("utf-8", "surrogatepass")
+        sys.stdout.write(json.dumps(_lint_text(text, cache)) + "\n"); sys.stdout.flush()
+
+LINT_BOOT = ("import importlib.util, sys; "
+             "spec = importlib.util.spec_from_file_location('runpad_lint', sys.argv[1]); "
+             "m = importlib.util.module_from_spec(spec); spec.loader.exec_module(m); m._lint_server()")
+
+# Un solo trabajo pendiente (el más reciente): las versiones intermedias del búfer se descartan.
+# ast.parse retiene el GIL, así que el análisis va en un proceso hijo; si no arranca, en este hilo.
+class LintWorker:
+    def __init__(self, notify):
+        self._notify = notify
+        self._cond = threading.Condition()
+        self._job = None
+        self._proc = None
+        self._local_cache = {}
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, gen, text, callback):
+        with self._cond:
+            self._job = (gen, text, callback); self._cond.notify()
+
+    def _child(self):
+        if self._proc is not None and self._proc.poll() is None: return self._proc
+        self._proc = None
+        src = os.path.abspath(__file__) if "__file__" in globals() else None
+        if not src or not os.path.isfile(src): return None
+        try:
+            kw = {"creationflags": subprocess.CREATE_NO_WINDOW} if os.name == "nt" else {}
+            self._proc = subprocess.Popen([sys.executable, "-c", LINT_BOOT, src], stdin=subprocess.PIPE,
+                                          stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, **kw)
+        except Exception:
+            self._proc = None
+        return self._proc
+
+    def _lint(self, text):
+        p = self._child()
+        if p is not None:
+            try:
+                data = text.encode("utf-8", "surrogatepass")
+                p.stdin.write(f"{len(data)}\n".encode() + data); p.stdin.flush()
+                line = p.stdout.readline()
+                if line: return json.loads(line)
+            except (OSError, ValueError):
+                pass
+            try: p.kill()
+            except Exception: pass
+            self._proc = None
+        return _lint_text(text, self._local_cache)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._job is None: self._cond.wait()
+                (gen, text, cb), self._job = self._job, None
+            try: diags = self._lint(text)
+            except Exception as e: diags = [[1, 0, None, "error", f"Verificador: {e}"]]
+            self._notify(lambda: cb(gen, diags))
+
+    def close(self):
+        if self._proc is not None:
+            try: self._proc.kill()
+            except Exception: pass
+
+# ========= Render de consola (\\r, ANSI) =========
+ANSI_RE = re.compile(r"\x1b(?:\[([0-9;?]*)([@-~])|\][^\x07\x1b]*(?:\x07|\x1b\\)|[@-Z\\-_])")
+CTRL_RE = re.compile(r"(\r\n|\r|\n|\x08)")
+ANSI_COLORS = {
+    30: "#4d4d4d", 31: "#ff5f56", 32: "#a6e22e", 33: "#ffd866", 34: "#66a3ff", 35: "#d88cff", 36: "#66d9ef", 37: "#e0e0e0",
+    90: "#7f7f7f", 91: "#ff8a80", 92: "#c3f584", 93: "#ffe9a0", 94: "#99c2ff", 95: "#e6b3ff", 96: "#a0ecf7", 97: "#ffffff",
+}
+
+def _splice(segs, col, text, tags):
+    # sobrescribe `text` en la columna `col` de una línea hecha de segmentos [(texto, tags)]
+    out, pos, end, placed = [], 0, col + len(text), False
+    for seg, tg in segs:
+        a, b = pos, pos + len(seg)
+        if b <= col or a >= end:
+            if a >= end and not placed: out.append((text, tags)); placed = True
+            out.append((seg, tg))
+        else:
+            if a < col: out.append((seg[:col - a], tg))
+            if not placed: out.append((text, tags)); placed = True
+            if b > end: out.append((seg[end - a:], tg))
+        pos = b
+    if not placed: out.append((text, tags))
+    return out
+
+def _truncate(segs, col):
+    out, pos = [], 0
+    for seg, tg in segs:
+        if pos >= col: break
+        out.append((seg[:col - pos], tg)); pos += len(seg)
+    return out
+
+# Modelo de la consola en Python: el texto completo se confirma y solo las líneas "vivas"
+# (las que \r reescribe) se redibujan; N reescrituras en un cuadro cuestan un redibujo.
+# Cada fuente (script de un lote) tiene su propia línea viva, cursor y estilo: un \r de un
+# script no pisa la línea a medias de otro, y solo se confirman líneas completas.
+class _ConsoleStream:
+    def __init__(self, out, tags):
+        self.out = out            # ConsoleRenderer al que se confirman las líneas
+        self.tags = tags          # etiqueta de la fuente; también va en los saltos de línea
+        self.line = []            # segmentos de la línea viva
+        self.line_len = 0
+        self.col = 0
+        self.style = ()
+        self.partial = ""         # secuencia de escape cortada entre trozos
+        self.pending_cr = False
+
+    def idle(self):
+        return not self.line and not self.partial and not self.pending_cr and not self.style
+
+    def write(self, text, extra):
+        if self.partial: text, self.partial = self.partial + text, ""
+        esc = text.rfind("\x1b", max(0, len(text) - 64))
+        if esc != -1 and not ANSI_RE.match(text, esc):
+            text, self.partial = text[:esc], text[esc:]
+        if self.pending_cr:
+            self.pending_cr = False
+            if text.startswith("\n"): self._newline(); text = text[1:]
+            else: self.col = 0
+        if text.endswith("\r"):
+            text, self.pending_cr = text[:-1], True
+        extra = tuple(extra) + self.tags
+        pos = 0
+        if "\x1b" in text:
+            for m in ANSI_RE.finditer(text):
+                self._plain(text[pos:m.start()], extra); self._escape(m); pos = m.end()
+        self._plain(text[pos:], extra)
+
+    def _plain(self, text, extra):
+        if not text: return
+        tags = self.style + extra
+        if "\r" not in text and "\x08" not in text and self.col == self.line_len:
+            # camino rápido: solo texto y saltos de línea al final de la línea viva
+            first, nl, rest = text.partition("\n")
+            self._put(first, tags)
+            if nl:
+                self._newline()
+                body, _, last = rest.rpartition("\n")
+                if _: self.out._commit(body + "\n", tags)
+                self._put(last, tags)
+            return
+        for piece in CTRL_RE.split(text):
+            if piece in ("\n", "\r\n"): self._newline()
+            elif piece == "\r": self.col = 0
+            elif piece == "\x08": self.col = max(0, self.col - 1)
+            elif piece: self._put(piece, tags)
+
+    def _put(self, text, tags):
+        if not text: return
+        if self.col == self.line_len:
+            if self.line and self.line[-1][1] == tags: self.line[-1] = (self.line[-1][0] + text, tags)
+            else: self.line.append((text, tags))
+        else:
+            self.line = _splice(self.line, self.col, text, tags)
+        self.col += len(text)
+        self.line_len = max(self.line_len, self.col)
+
+    def _newline(self):
+        for seg, tg in self.line: self.out._commit(seg, tg)
+        self.out._commit("\n", self.tags)
+        self.line, self.line_len, self.col = [], 0, 0
+
+    def _escape(self, m):
+        if m.group(2) == "m":
+            style = set(self.style)
+            codes = [int(c) for c in (m.group(1) or "0").split(";") if c.isdigit()] or [0]
+            for c in codes:
+                if c == 0: style.clear()
+                elif c == 1: style.add("ansi_bold")
+                elif c == 4: style.add("ansi_ul")
+                elif c == 22: style.discard("ansi_bold")
+                elif c == 24: style.discard("ansi_ul")
+                elif c == 39 or c in ANSI_COLORS:
+                    style = {t for t in style if not t.startswith("ansi_fg_")}
+                    if c != 39: style.add(f"ansi_fg_{c}")
+            self.style = tuple(sorted(style))
+        elif m.group(2) == "K":
+            mode = m.group(1) or "0"
+            if mode == "0":
+                self.line = _truncate(self.line, self.col); self.line_len = self.col
+            elif mode == "1":
+                self.line = _splice(self.line, 0, " " * self.col, self.tags)
+            elif mode == "2":
+                self.line = [(" " * self.col, self.tags)] if self.col else []; self.line_len = self.col
+        # otras secuencias (movimiento de cursor, títulos…) se descartan
+
+class ConsoleRenderer:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.done = []        # segmentos confirmados aún no volcados al widget
+        self.streams = {}     # fuente (etiqueta o None) → _ConsoleStream
+        self.dirty = False
+
+    def write(self, text, extra=(), source=None):
+        # extra: etiquetas solo de este trozo (enlaces); source: etiqueta de la fuente
+        if not text: return
+        self.dirty = True
+        st = self.streams.get(source)
+        if st is None: st = self.streams[source] = _ConsoleStream(self, (source,) if source else ())
+        st.write(text, extra)
+
+    def _commit(self, text, tags):
+        if self.done and self.done[-1][1] == tags: self.done[-1][0].append(text)
+        else: self.done.append(([text], tags))
+
+    def flush(self):
+        # → (segmentos confirmados, segmentos de las líneas vivas) y marca el modelo como limpio;
+        # las líneas vivas van una por fuente, bajo el texto confirmado
+        done = [("".join(parts), tags) for parts, tags in self.done]
+        self.done = []; self.dirty = False
+        live = []
+        for source, st in list(self.streams.items()):
+            if st.idle():
+                del self.streams[source]; continue
+            if not st.line: continue
+            if live: live.append(("\n", live_tags))
+            live.extend(st.line); live_tags = st.tags
+        return done, live
+
+# ========= Latencia de la interfaz =========
+FRAME_MS = 16.7
+LATENCY_BUCKETS_MS = (1, 2, 4, 8, FRAME_MS, 33, 66, 133, 250, 500, 1000)
+LATENCY_TRACE_MAX = 200000
+
+def _callback_name(fn):
+    code = getattr(fn, "__code__", None)
+    if code is not None and code.co_name == "callit" and "func" in code.co_freevars:
+        # after(): la función programada está en el cierre de callit
+        fn = fn.__closure__[code.co_freevars.index("func")].cell_contents
+        code = getattr(fn, "__code__", None)
+    name = getattr(fn, "__qualname__", None) or type(fn).__name__
+    if "<lambda>" in name and code is not None:
+        name = f"{name.replace('.<locals>', '')}:{code.co_firstlineno}"
+    return name
+
+class UILatency:
+    # tiempos de los callbacks del hilo de Tk: histograma por manejador y traza para chrome://tracing
+    def __init__(self):
+        self.enabled = False
+        self.reset()
+
+    def reset(self):
+        self.stats = {}
+        self.trace = deque(maxlen=LATENCY_TRACE_MAX)
+
+    def record(self, name, t0, t1):
+        ms = (t1 - t0) * 1000
+        st = self.stats.get(name)
+        if st is None:
+            st = self.stats[name] = {"n": 0, "total": 0.0, "max": 0.0, "slow": 0,
+                                     "hist": [0] * (len(LATENCY_BUCKETS_MS) + 1)}
+        st["n"] += 1; st["total"] += ms; st["max"] = max(st["max"], ms)
+        st["hist"][bisect.bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+        if ms > FRAME_MS: st["slow"] += 1
+        self.trace.append((name, t0, t1 - t0))
+
+    def wrap(self, name, fn):
+        def timed(*args, **kw):
+            if not self.enabled: return fn(*args, **kw)
+            t0 = time.perf_counter()
+            try: return fn(*args, **kw)
+            finally: self.record(name, t0, time.perf_counter())
+        timed.__qualname__ = name; timed._timed = True
+        return timed
+
+    @staticmethod
+    def percentile(st, q):
+        # cota superior del cubo donde cae el percentil q
+        target, acc = q * st["n"], 0
+        for i, c in enumerate(st["hist"]):
+            acc += c
+            if acc >= target:
+                return min(LATENCY_BUCKETS_MS[i], st["max"]) if i < len(LATENCY_BUCKETS_MS) else st["max"]
+        return st["max"]
+
+    def slowest(self, key="max"):
+        return sorted(self.stats.items(), key=lambda kv: kv[1][key], reverse=True)
+
+    def export_trace(self, path):
+        pid = os.getpid()
+        events = [{"name": name, "cat": "slow" if dur * 1000 > FRAME_MS else "ui", "ph": "X",
+                   "ts": round((t0 - _T_START) * 1e6, 1), "dur": round(dur * 1e6, 1), "pid": pid, "tid": 1}
+                  for name, t0, dur in list(self.trace)]
+        events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": 1, "args": {"name": "Tk"}})
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return len(events) - 1
+
+UI_LATENCY = UILatency()
+
+class _TimedCallWrapper(tk.CallWrapper):
+    # todo command=, bind() y after() pasa por CallWrapper; RunPad lo instala antes de crear
+    # widgets y restaura el original al cerrar (importar el módulo no toca tkinter)
+    def __call__(self, *args):
+        if not UI_LATENCY.enabled or getattr(self.func, "_timed", False):
+            return super().__call__(*args)
+        t0 = time.perf_counter()
+        try: return super().__call__(*args)
+        finally: UI_LATENCY.record(_callback_name(self.func), t0, time.perf_counter())
+
+# ========= Diario de edición (autoguardado) =========
+JOURNAL_IDLE_MS = 1500          # pausa de tecleo antes de registrar
+JOURNAL_MAX_MS = 10000          # tecleo continuo: registrar al menos cada tanto
+JOURNAL_COMPACT_RECORDS = 400   # deltas antes de reescribir el diario como una sola base
+
+def _text_delta(old, new):
+    # (inicio, caracteres borrados, texto insertado) por prefijo y sufijo comunes
+    n = min(len(old), len(new))
+    start, step = 0, 4096
+    while start < n and old[start:start + step] == new[start:start + step]: start += step
+    while start < n and old[start] == new[start]: start += 1
+    end_old, end_new = len(old), len(new)
+    while end_old - step > start and end_new - step > start and \
+            old[end_old - step:end_old] == new[end_new - step:end_new]:
+        end_old -= step; end_new -= step
+    while end_old > start and end_new > start and old[end_old - 1] == new[end_new - 1]:
+        end_old -= 1; end_new -= 1
+    return start, end_old - start, new[start:end_new]
+
+def _replay_journal(path):
+    # → (ruta del documento, texto); una última línea cortada (caída a mitad de escritura) se ignora
+    doc_path, text = None, None
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for line in f:
+            try: rec = json.loads(line)
+            except ValueError: break
+            if rec.get("t") == "base":
+                text, doc_path = rec["text"], rec.get("path")
+            elif rec.get("t") == "d" and text is not None:
+                o = rec["o"]; text = text[:o] + rec["s"] + text[o + rec["x"]:]
+                doc_path = rec.get("path", doc_path)
+    return doc_path, text
+
+def _pid_alive(pid):
+    if pid == os.getpid(): return True
+    if os.name == "nt":
+        import ctypes
+        h = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not h: return False
+        ctypes.windll.kernel32.CloseHandle(h); return True
+    try: os.kill(pid, 0)
+    except ProcessLookupError: return False
+    except OSError: return True
+    return True
+
+class EditJournal:
+    # un archivo de solo-añadir por documento (<pid>-<id>.jnl): una base y luego deltas.
+    # Todo el trabajo de disco ocurre en un hilo propio; el hilo de Tk solo encola el texto.
+    def __init__(self, directory=JOURNAL_DIR):
+        self.dir = directory
+        self.pid = os.getpid()
+        self._q = queue.Queue()
+        self._last = (None, None)   # (id, texto) del último registro: base para el siguiente delta
+        self._records = {}
+        self._paths = {}
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _file(self, doc_id):
+        return os.path.join(self.dir, f"{self.pid}-{doc_id}.jnl")
+
+    def record(self, doc_id, path, text): self._q.put(("rec", doc_id, path, text))
+    def discard(self, doc_id): self._q.put(("del", doc_id, None, None))
+    def remove_file(self, path): self._q.put(("rm", None, path, None))
+
+    def close(self, timeout=5.0):
+        done = threading.Event()
+        self._q.put(("stop", None, None, done)); done.wait(timeout)
+
+    def _run(self):
+        while True:
+            op, doc_id, path, text = self._q.get()
+            try:
+                if op == "rec": self._append(doc_id, path, text)
+                elif op == "del":
+                    self._records.pop(doc_id, None); self._paths.pop(doc_id, None)
+                    if self._last[0] == doc_id: self._last = (None, None)
+                    os.remove(self._file(doc_id))
+                elif op == "rm": os.remove(path)
+                elif op == "stop": text.set(); return
+            except OSError:
+                pass
+
+    def _append(self, doc_id, path, text):
+        jp = self._file(doc_id)
+        n = self._records.get(doc_id)
+        if self._last[0] != doc_id or n is None or n >= JOURNAL_COMPACT_RECORDS or not os.path.exists(jp):
+            # compactar: el diario pasa a ser una sola base con el texto actual
+            os.makedirs(self.dir, exist_ok=True)
+            with open(jp + ".tmp", "w", encoding="utf-8", newline="") as f:
+                f.write(json.dumps({"t": "base", "path": path, "ts": time.time(), "text": text}) + "\n")
+                f.flush(); os.fsync(f.fileno())
+            os.replace(jp + ".tmp", jp)
+            self._records[doc_id] = 1
+        else:
+            start, deleted, inserted = _text_delta(self._last[1], text)
+            if deleted or inserted or path != self._paths.get(doc_id):
+                rec = {"t": "d", "o": start, "x": deleted, "s": inserted}
+                if path != self._paths.get(doc_id): rec["path"] = path
+                with open(jp, "a", encoding="utf-8", newline="") as f:
+                    f.write(json.dumps(rec) + "\n"); f.flush(); os.fsync(f.fileno())
+                self._records[doc_id] = n + 1
+        self._last = (doc_id, text); self._paths[doc_id] = path
+
+    @staticmethod
+    def leftovers(directory=JOURNAL_DIR):
+        # diarios de sesiones que ya no corren → [(archivo, ruta, texto, mtime)]
+        found = []
+        try: names = sorted(os.listdir(directory))
+        except OSError: return found
+        for name in names:
+            if not name.endswith(".jnl"): continue
+            try: pid = int(name.split("-", 1)[0])
+            except ValueError: continue
+            if _pid_alive(pid): continue
+            jp = os.path.join(directory, name)
+            try:
+                doc_path, text = _replay_journal(jp)
+                mtime = os.path.getmtime(jp)
+            except (OSError, ValueError, KeyError):
+                continue
+            if text is not None: found.append((jp, doc_path, text, mtime))
+        return found
+
+# ========= Perfil de arranque =========
+class StartupProfile:
+    # marca fases del arranque y las imprime al terminar el primer listado de carpeta
+    def __init__(self, enabled, t0):
+        self.enabled = enabled
+        self.t0 = self.last = t0
+        self.phases = []
+        self.done = False
+
+    def mark(self, name):
+        if not self.enabled or self.done: return
+        now = time.perf_counter()
+        self.phases.append((name, now - self.last)); self.last = now
+
+    def report(self, out=None):
+        if not self.enabled or self.done: return None
+        self.done = True
+        total = self.last - self.t0
+        width = max(len(n) for n, _ in self.phases + [("total", 0)])
+        lines = ["Perfil de arranque:"]
+        for name, dt in self.phases:
+            lines.append(f"  {name:<{width}}  {dt * 1000:8.1f} ms  {dt / total * 100 if total else 0:5.1f}%")
+        lines.append(f"  {'total':<{width}}  {total * 1000:8.1f} ms")
+        print("\n".join(lines), file=out or sys.stderr, flush=True)
+        return total
+
+STARTUP = StartupProfile("--startup-profile" in sys.argv, _T_START)
+
 # ========= App =========
 class RunPad:
     def __init__(self, root):
@@ -78,25 +1742,99 @@ class RunPad:
 
         self.current_file = None
         self.file_modified = False
+        # pestañas: solo el documento activo vive en el Text; el resto son instantáneas comprimidas
+        self.doc = self._new_doc()
+        self.docs = [self.doc]
+        self.journal = EditJournal()
+        self._journal_job = None
+        self._journal_due = None
 
         self.scripts_list = []
         self.scripts_marked = set()
-        # restaurar automatizador
+        # restaurar automatizador (las rutas que ya no existen se descartan en _prune_automator)
         if self.settings.get("persist_automator", True):
-            self.scripts_list = [p for p in self.settings.get("automator_items", []) if os.path.exists(p)]
-            self.scripts_marked = set([p for p in self.settings.get("automator_marked", []) if os.path.exists(p)])
+            self.scripts_list = list(self.settings.get("automator_items", []))
+            self.scripts_marked = set(self.settings.get("automator_marked", []))
 
         self.proc_lock = threading.Lock()
-        self.running_procs = []
+        self.supervisor = ProcessSupervisor()
+        self._remote_socks = set()   # conexiones con agentes en curso (stop_all las corta)
+        self._session_started = time.time()   # "esta sesión" en la búsqueda de logs
+        self._log_search_gen = 0
+        self._history = None
+        self._history_opened = False
+        self._history_lock = threading.Lock()
         self.output_queue = queue.Queue()
+        self.kernel = None
+        self._kernel_pending = 0
+        self._watch_gen = 0
+        self._watch_proc = None
+        self._watch_job = None
+        self._watch_poll_job = None
+        self._watch_mtime = None
+        # callables a ejecutar en el hilo de Tk (resultados de hilos de trabajo)
+        self.ui_calls = queue.Queue()
+        self.file_ops = FileOpsQueue(self.ui_calls.put, self._on_file_op_progress)
+        self.linter = LintWorker(self.ui_calls.put)
+        self.import_graph = ImportGraph()
+        self._lint_gen = 0
+        self._lint_job = None
+        self._diag_msgs = {}   # línea → mensaje
+        self._diag_gutter = {}  # línea → "error" | "warn"
+        self._panels_ready = False
+        self._scan_gen = 0
+        self._scan_job = None
+        self._listing = None   # (carpeta, archivos, subcarpetas) del último escaneo
+        UI_LATENCY.enabled = bool(self.settings.get("ui_latency", False))
+        self._orig_call_wrapper, tk.CallWrapper = tk.CallWrapper, _TimedCallWrapper
+        # métodos que corren dentro de otros callbacks: se miden por separado
+        for name in ("_highlight_all", "_update_linenos", "refresh_file_list", "_apply_scan",
+                     "_render_console", "_apply_gutter_marks"):
+            setattr(self, name, UI_LATENCY.wrap(f"RunPad.{name}", getattr(self, name)))
+        self._latency_win = None
+        STARTUP.mark("ajustes y estado")
 
         self._dragging = False
         self._init_styles()
         self._build_ui()
         self._bind_shortcuts()
-        self.refresh_file_list()
         self._drain_output_queue()
         self.root.protocol("WM_DELETE_WINDOW", self._on_close)
+        STARTUP.mark("editor y consola")
+        # el panel derecho y el listado de carpeta se construyen cuando la ventana ya se ve
+        self.root.after_idle(self._finish_startup)
+
+    @property
+    def history(self):
+        # la base de historial se abre en el primer uso; None si no se puede abrir
+        with self._history_lock:
+            if not self._history_opened:
+                self._history_opened = True
+                try:
+                    self._history = RunHistory()
+                except Exception:
+                    self._history = None
+            return self._history
+
+    def _finish_startup(self):
+        STARTUP.mark("primer frame")
+        self._build_side_panels()
+        STARTUP.mark("paneles laterales")
+        self._scan_directory()
+        threading.Thread(target=self._check_leftover_journals, daemon=True).start()
+        threading.Thread(target=self._check_saved_batch, daemon=True).start()
+        if self.scripts_list:
+            threading.Thread(target=self._prune_automator,
+                             args=(list(self.scripts_list),), daemon=True).start()
+
+    def _prune_automator(self, paths):
+        missing = {p for p in paths if not os.path.exists(p)}
+        if missing: self.ui_calls.put(lambda: self._drop_automator_paths(missing))
+
+    def _drop_automator_paths(self, missing):
+        self.scripts_list = [p for p in self.scripts_list if p not in missing]
+        self.scripts_marked -= missing
+        self._refresh_script_box()
 
     # ========= Styles =========
     def _init_styles(self):
@@ -156,11 +1894,46 @@ class RunPad:
         run_menu = tk.Menu(menubar, tearoff=0)
         run_menu.add_command(label="Ejecutar archivo actual (F5)", command=self.run_file)
         run_menu.add_command(label="Ejecutar scripts del automatizador", command=self.run_scripts_list)
+        run_menu.add_command(label="Ejecutar solo afectados por cambios", command=self.run_affected)
+        run_menu.add_command(label="Reanudar lote", command=self.resume_batch)
         run_menu.add_command(label="Detener ejecución", command=self.stop_all)
+        run_menu.add_command(label="Modo vigilancia (re-ejecutar al guardar)",
+                             command=lambda: (self.watch_var.set(not self.watch_var.get()), self._toggle_watch()))
+        run_menu.add_separator()
+        run_menu.add_command(label="Límites por defecto…", command=lambda: self.edit_limits(None))
+        run_menu.add_command(label="Concurrencia del lote…", command=self.set_batch_concurrency)
+        self.preflight_var = tk.BooleanVar(value=self.settings.get("preflight", True))
+        run_menu.add_checkbutton(label="Verificar sintaxis antes del lote", variable=self.preflight_var,
+                                 command=lambda: self.settings.__setitem__("preflight", self.preflight_var.get()))
+        self.agents_var = tk.BooleanVar(value=self.settings.get("use_agents", False))
+        run_menu.add_checkbutton(label="Repartir el lote entre agentes remotos", variable=self.agents_var,
+                                 command=lambda: self.settings.__setitem__("use_agents", self.agents_var.get()))
+        run_menu.add_command(label="Agentes remotos…", command=self.edit_agents)
         menubar.add_cascade(label="Ejecutar", menu=run_menu)
 
+        kernel_menu = tk.Menu(menubar, tearoff=0)
+        kernel_menu.add_command(label="Ejecutar selección/línea (Ctrl+Enter)", command=self.kernel_run_selection)
+        kernel_menu.add_command(label="Ejecutar celda # %% (Shift+Enter)", command=self.kernel_run_cell)
+        kernel_menu.add_command(label="Ejecutar archivo en el kernel", command=self.kernel_run_buffer)
+        kernel_menu.add_separator()
+        kernel_menu.add_command(label="Interrumpir (Ctrl+I)", command=self.kernel_interrupt)
+        kernel_menu.add_command(label="Reiniciar", command=self.kernel_restart)
+        kernel_menu.add_command(label="Detener", command=self.kernel_stop)
+        menubar.add_cascade(label="Kernel", menu=kernel_menu)
+
         tools_menu = tk.Menu(menubar, tearoff=0)
         tools_menu.add_command(label="Abrir terminal", command=self.open_terminal)
+        tools_menu.add_command(label="Cancelar operación de archivos", command=self.cancel_file_ops)
+        tools_menu.add_command(label="Historial de ejecuciones", command=self.open_history_panel)
+        tools_menu.add_command(label="Buscar en ejecuciones (Ctrl+Shift+F)", command=self.open_log_search)
+        self.lint_var = tk.BooleanVar(value=self.settings.get("lint", True))
+        tools_menu.add_checkbutton(label="Verificación de código en segundo plano", variable=self.lint_var,
+                                   command=self._toggle_lint)
+        tools_menu.add_separator()
+        self.latency_var = tk.BooleanVar(value=UI_LATENCY.enabled)
+        tools_menu.add_checkbutton(label="Medir latencia de la interfaz", variable=self.latency_var,
+                                   command=self._toggle_latency)
+        tools_menu.add_command(label="Panel de latencia (F9)", command=self.toggle_latency_panel)
         menubar.add_cascade(label="Herramientas", menu=tools_menu)
         self.root.config(menu=menubar)
 
@@ -172,6 +1945,10 @@ class RunPad:
         self._btn(toolbar, "Ejecutar ▶", self.run_file).pack(side='left', padx=8)
         self._btn_orange(toolbar, "Python ▶", self.run_python_current).pack(side='left', padx=8)
         self._btn(toolbar, "Detener ⏹", self.stop_all).pack(side='left', padx=8)
+        self.watch_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(toolbar, text="Vigilar ⟲", variable=self.watch_var, command=self._toggle_watch,
+                       bg=BG_COLOR, fg=FG_COLOR, selectcolor=BTN_BG, activebackground=BG_COLOR,
+                       activeforeground=FG_COLOR, highlightthickness=0).pack(side='left', padx=8)
         self._btn(toolbar, "Abrir Terminal", self.open_terminal).pack(side='left', padx=8)
         self._btn(toolbar, "Limpiar salida", self.clear_output).pack(side='left', padx=8)
         self._btn(toolbar, "Copiar salida", self.copy_output).pack(side='left', padx=8)
@@ -186,11 +1963,14 @@ class RunPad:
 
         editor_frame = tk.LabelFrame(left, text="Editor", bg=PANEL_BG, fg=ACCENT)
         left.add(editor_frame, stretch="always")
+        self.tab_bar = tk.Frame(editor_frame, bg=PANEL_BG); self.tab_bar.pack(fill='x')
         editor_container = tk.Frame(editor_frame, bg=PANEL_BG); editor_container.pack(fill='both', expand=True)
 
         self.linenos = tk.Text(editor_container, width=6, padx=6, takefocus=0, bg="#1b1b1b",
                                fg="#9e9e9e", state='disabled', relief="flat")
         self.linenos.pack(side='left', fill='y')
+        self.linenos.tag_configure("gut_error", background="#8b1e1e", foreground="#ffffff")
+        self.linenos.tag_configure("gut_warn", background="#5c4a12", foreground="#ffffff")
 
         self.editor = tk.Text(
             editor_container,
@@ -207,6 +1987,8 @@ class RunPad:
 
         # Tabs a 4 espacios
         self._set_editor_tabs(4)
+        self.editor.tag_configure("diag_error", underline=True, background="#4a1f1f")
+        self.editor.tag_configure("diag_warn", underline=True)
 
         yscroll = ttk.Scrollbar(editor_container, orient='vertical',
                                 command=self._on_scroll, style="Dark.Vertical.TScrollbar")
@@ -218,9 +2000,23 @@ class RunPad:
         self.editor.bind("<KeyRelease>", lambda e: (self._update_status_caret(), self._highlight_all()))
         self.editor.bind("<ButtonRelease-1>", lambda e: self._update_status_caret())
         self.editor.bind("<Tab>", self._soft_tab)
+        self.editor.bind("<Control-Return>", lambda e: (self.kernel_run_selection(), "break")[1])
+        self.editor.bind("<Shift-Return>", lambda e: (self.kernel_run_cell(), "break")[1])
+        self.editor.bind("<Control-i>", lambda e: (self.kernel_interrupt(), "break")[1])
+        # el Text usa Ctrl+Tab para mover el foco: aquí cambia de pestaña
+        self.editor.bind("<Control-Tab>", lambda e: (self._cycle_doc(1), "break")[1])
+        self.editor.bind("<Control-Shift-Tab>", lambda e: (self._cycle_doc(-1), "break")[1])
 
         out_frame = tk.LabelFrame(left, text="Consola", bg=PANEL_BG, fg=ACCENT)
         left.add(out_frame)
+        out_bar = tk.Frame(out_frame, bg=PANEL_BG); out_bar.pack(fill='x')
+        tk.Label(out_bar, text="Mostrar:", bg=PANEL_BG, fg=FG_COLOR).pack(side='left', padx=(4,2))
+        self.console_filter_var = tk.StringVar(value="Todos")
+        self.console_filter = ttk.Combobox(out_bar, textvariable=self.console_filter_var, values=["Todos"],
+                                           state='readonly', width=28)
+        self.console_filter.pack(side='left', pady=2)
+        self.console_filter.bind("<<ComboboxSelected>>", lambda e: self._apply_console_filter())
+        self._btn_sm(out_bar, "Buscar en ejecuciones", self.open_log_search).pack(side='right', padx=4, pady=2)
         out_container = tk.Frame(out_frame, bg=PANEL_BG); out_container.pack(fill='both', expand=True)
         self.output = tk.Text(out_container, height=14, wrap='word', font=("Consolas", 11),
                               bg=BG_COLOR, fg=FG_COLOR, insertbackground=FG_COLOR,
@@ -230,9 +2026,33 @@ class RunPad:
                                    command=self.output.yview, style="Dark.Vertical.TScrollbar")
         out_scroll.pack(side='right', fill='y')
         self.output.config(yscrollcommand=out_scroll.set)
+        self._links = {}
+        self._sources = {}   # script → etiqueta de su salida en la consola (filtro por script)
+        self.console = ConsoleRenderer()
+        self.output.mark_set("live", "end-1c"); self.output.mark_gravity("live", "left")
+        for code, color in ANSI_COLORS.items(): self.output.tag_configure(f"ansi_fg_{code}", foreground=color)
+        self.output.tag_configure("ansi_bold", font=("Consolas", 11, "bold"))
+        self.output.tag_configure("ansi_ul", underline=True)
+        self.output.tag_configure("link", foreground=ACCENT_2, underline=True)
+        self.output.tag_bind("link", "<Button-1>", self._on_output_link)
+        self.output.tag_bind("link", "<Enter>", lambda e: self.output.config(cursor="hand2"))
+        self.output.tag_bind("link", "<Leave>", lambda e: self.output.config(cursor=""))
+
+        # Derecha: se rellena en _build_side_panels tras el primer frame
+        self._right_outer = tk.Frame(main, bg=PANEL_BG); main.add(self._right_outer, width=720)
+
+        # Status
+        self.status = tk.Label(self.root, text="Listo", anchor='w', bg=BG_COLOR, fg=ACCENT_2)
+        self.status.pack(fill='x', side='bottom')
+
+        self._build_context_menu()
+        self._toggle_wrap()
+        self._apply_highlight_tags()
+        self._render_tabs()
 
+    def _build_side_panels(self):
         # Derecha: contenedor desplazable (Canvas + Scrollbar)
-        right_outer = tk.Frame(main, bg=PANEL_BG); main.add(right_outer, width=720)
+        right_outer = self._right_outer
         self.right_canvas = tk.Canvas(right_outer, bg=PANEL_BG, highlightthickness=0)
         right_scroll = ttk.Scrollbar(right_outer, orient='vertical',
                                      command=self.right_canvas.yview, style="Dark.Vertical.TScrollbar")
@@ -297,6 +2117,8 @@ class RunPad:
         self._btn(sub_btns, "Nueva", self.new_subfolder).pack(side='left', padx=4)
         self._btn(sub_btns, "Renombrar", self.rename_selected_subfolder).pack(side='left', padx=4)
         self._btn(sub_btns, "Eliminar", self.delete_selected_subfolder).pack(side='left', padx=4)
+        self._btn(sub_btns, "Duplicar", self.duplicate_selected_subfolder).pack(side='left', padx=4)
+        self._btn(sub_btns, "Cancelar op.", self.cancel_file_ops).pack(side='left', padx=4)
 
         # Archivos
         file_frame = tk.LabelFrame(right, text="Archivos (multi-selección y arrastre → Automatizador)", bg=PANEL_BG, fg=ACCENT)
@@ -335,6 +2157,8 @@ class RunPad:
         self._btn_sm(row2, "Marcar todo", self.mark_all).pack(side='left', padx=3)
         self._btn_sm(row2, "Desmarcar todo", self.unmark_all).pack(side='left', padx=3)
         self._btn_sm(row2, "Limpiar lista", self.clear_list).pack(side='left', padx=3)
+        self._btn_sm(row2, "Ejecutar afectados", self.run_affected).pack(side='left', padx=3)
+        self._btn_sm(row2, "Reanudar lote", self.resume_batch).pack(side='left', padx=3)
 
         list_container = tk.Frame(auto_frame, bg=PANEL_BG); list_container.pack(fill='both', expand=True, padx=6, pady=(0,6))
         self.script_box = tk.Listbox(
@@ -352,15 +2176,8 @@ class RunPad:
         # Botón inferior
         self._btn_sm(auto_frame, "Ejecutar scripts ▶", self.run_scripts_list).pack(fill='x', padx=6, pady=(0,6))
 
-        # Status
-        self.status = tk.Label(self.root, text="Listo", anchor='w', bg=BG_COLOR, fg=ACCENT_2)
-        self.status.pack(fill='x', side='bottom')
-
-        self._build_context_menu()
-        self._toggle_wrap()
-        self._apply_highlight_tags()
-        self._highlight_all()
-        self._refresh_subfolders()
+        self._panels_ready = True
+        self._refresh_script_box()
 
     def _bind_shortcuts(self):
         self.root.bind_all("<Control-s>", lambda e: self.save_file(show_popup=True))
@@ -377,6 +2194,13 @@ class RunPad:
         self.root.bind_all("<Control-f>", lambda e: self.open_find_dialog())
         self.root.bind_all("<Control-h>", lambda e: self.open_replace_dialog())
         self.root.bind_all("<Control-l>", lambda e: self.clear_output())
+        self.root.bind_all("<Control-F>", lambda e: self.open_log_search())
+        self.root.bind_all("<F9>", lambda e: self.toggle_latency_panel())
+        self.root.bind_all("<Control-w>", lambda e: self.close_doc(self.doc))
+        self.root.bind_all("<Control-Tab>", lambda e: (self._cycle_doc(1), "break")[1])
+        self.root.bind_all("<Control-Shift-Tab>", lambda e: (self._cycle_doc(-1), "break")[1])
+        if self.root.tk.call("tk", "windowingsystem") == "x11":
+            self.root.bind_all("<Control-ISO_Left_Tab>", lambda e: (self._cycle_doc(-1), "break")[1])
 
     # ========= Editor =========
     def _set_editor_tabs(self, spaces=4):
@@ -396,10 +2220,14 @@ class RunPad:
         self._set_status("Editor limpio")
 
     def new_file(self):
-        if not self._maybe_discard_changes(mode="prompt"): return
-        self.editor.delete('1.0','end')
+        if not self._doc_is_blank():
+            pos = self.docs.index(self.doc) + 1
+            self._snapshot_active()
+            self.doc = self._new_doc(); self.docs.insert(pos, self.doc)
+        self.editor.delete('1.0','end'); self.editor.edit_reset(); self.editor.edit_modified(False)
         self.current_file = None
         self.file_modified = False
+        self._render_tabs()
         if not hasattr(self, "filename_var"): self.filename_var = tk.StringVar(value="")
         if not hasattr(self, "ext_var"): self.ext_var = tk.StringVar(value=".py")
         self.filename_var.set(""); self.ext_var.set(".py")
@@ -417,14 +2245,17 @@ class RunPad:
         else:
             base = self.filename_var.get().strip() or os.path.splitext(os.path.basename(self.current_file))[0]
             ext = self.ext_var.get().strip() or os.path.splitext(self.current_file)[1]
-            new_path = os.path.join(self.current_directory, base+ext)
+            new_path = os.path.join(os.path.dirname(self.current_file), base+ext)
             if new_path != self.current_file: self.current_file = new_path
         try:
             with open(self.current_file, 'w', encoding='utf-8') as f:
                 f.write(self.editor.get('1.0', 'end-1c'))
             self.file_modified = False
+            self._journal_drop(self.doc)
+            self._render_tabs()
             self._set_status(f"Guardado: {os.path.basename(self.current_file)}")
-            if show_popup:
+            if self.watch_var.get(): self._watch_trigger()
+            if show_popup and not self.watch_var.get():
                 messagebox.showinfo("Guardado", f"Archivo guardado:\n{self.current_file}")
             self.refresh_file_list()
         except Exception as e:
@@ -442,9 +2273,13 @@ class RunPad:
 
     def _on_modified(self, _e=None):
         if self.editor.edit_modified():
+            was = self.file_modified
             self.file_modified = True
             self.editor.edit_modified(False)
+            if not was: self._render_tabs()
+            self._schedule_journal()
             self._update_linenos()
+            self._schedule_lint()
 
     def _update_linenos(self, force=False):
         if not force and getattr(self, "_ln_last", None) == self.editor.index("end-1c"):
@@ -453,6 +2288,7 @@ class RunPad:
         self.linenos.config(state='normal'); self.linenos.delete('1.0','end')
         last_line = int(self.editor.index('end-1c').split('.')[0])
         self.linenos.insert('1.0', "\n".join(str(i) for i in range(1, last_line+1)))
+        self._apply_gutter_marks()
         self._sync_linenos(); self.linenos.config(state='disabled')
 
     def _sync_linenos(self):
@@ -471,6 +2307,56 @@ class RunPad:
         self.editor.config(font=("Consolas", size))
         self._set_editor_tabs(4)
 
+    # ---- Verificación en segundo plano ----
+    LINT_DELAY_MS = 350
+    LINT_MAX_MARKS = 1000
+
+    def _lint_enabled(self):
+        if not self.lint_var.get(): return False
+        if self.current_file: ext = os.path.splitext(self.current_file)[1]
+        elif hasattr(self, "ext_var"): ext = self.ext_var.get()
+        else: ext = ".py"
+        return ext.lower() in ALLOWED_EXTS
+
+    def _toggle_lint(self):
+        self.settings["lint"] = bool(self.lint_var.get())
+        if self.settings["lint"]: self._schedule_lint()
+        else: self._apply_diagnostics(self._lint_gen, [])
+
+    def _schedule_lint(self):
+        if self._lint_job is not None: self.root.after_cancel(self._lint_job)
+        self._lint_job = self.root.after(self.LINT_DELAY_MS, self._start_lint)
+
+    def _start_lint(self):
+        self._lint_job = None
+        self._lint_gen += 1
+        if not self._lint_enabled():
+            self._apply_diagnostics(self._lint_gen, []); return
+        self.linter.submit(self._lint_gen, self.editor.get('1.0', 'end-1c'), self._apply_diagnostics)
+
+    def _apply_diagnostics(self, gen, diags):
+        if gen != self._lint_gen: return  # resultado de una versión anterior del texto
+        for t in ("diag_error", "diag_warn"): self.editor.tag_remove(t, "1.0", "end")
+        self._diag_msgs = {}; self._diag_gutter = {}
+        for line, col, end, sev, msg in diags[:self.LINT_MAX_MARKS]:
+            tag = "diag_error" if sev == "error" else "diag_warn"
+            stop = f"{line}.{end}" if end is not None else f"{line}.0 lineend"
+            self.editor.tag_add(tag, f"{line}.{col}", stop)
+            if self.editor.compare(f"{line}.{col}", "==", stop):  # error al final de línea
+                self.editor.tag_add(tag, f"{line}.{col} -1c", stop)
+            self._diag_msgs.setdefault(line, msg)
+            if self._diag_gutter.get(line) != "error": self._diag_gutter[line] = sev
+        self.editor.tag_raise("diag_error")
+        self.linenos.config(state='normal'); self._apply_gutter_marks(); self.linenos.config(state='disabled')
+        n_err = sum(1 for d in diags if d[3] == "error")
+        if diags and not self._diag_msgs.get(int(self._cursor_line())):
+            self._set_status(f"Verificación: {n_err} error(es), {len(diags) - n_err} aviso(s)")
+
+    def _apply_gutter_marks(self):
+        for t in ("gut_error", "gut_warn"): self.linenos.tag_remove(t, "1.0", "end")
+        for line, sev in self._diag_gutter.items():
+            self.linenos.tag_add("gut_error" if sev == "error" else "gut_warn", f"{line}.0", f"{line}.end")
+
     # ---- Highlighting ----
     def _apply_highlight_tags(self):
         self.editor.tag_configure("sym", foreground=self.symbol_color.get())
@@ -478,18 +2364,21 @@ class RunPad:
         self.editor.tag_configure("alpha", foreground=self.alpha_color.get())
 
     def choose_symbol_color(self):
+        from tkinter import colorchooser
         c = colorchooser.askcolor(color=self.symbol_color.get(), title="Color para símbolos")
         if c and c[1]:
             self.symbol_color.set(c[1]); self.settings["symbol_color"] = self.symbol_color.get()
             save_settings(self.settings); self._apply_highlight_tags(); self._highlight_all()
 
     def choose_number_color(self):
+        from tkinter import colorchooser
         c = colorchooser.askcolor(color=self.number_color.get(), title="Color para números")
         if c and c[1]:
             self.number_color.set(c[1]); self.settings["number_color"] = self.number_color.get()
             save_settings(self.settings); self._apply_highlight_tags(); self._highlight_all()
 
     def choose_alpha_color(self):
+        from tkinter import colorchooser
         c = colorchooser.askcolor(color=self.alpha_color.get(), title="Color para letras")
         if c and c[1]:
             self.alpha_color.set(c[1]); self.settings["alpha_color"] = self.alpha_color.get()
@@ -518,24 +2407,238 @@ class RunPad:
             end = f"{pos}+1c"; self.editor.tag_add("alpha", pos, end); idx = end
         self.editor.tag_raise("sym"); self.editor.tag_lower("alpha"); self.editor.tag_lower("num")
 
+    # ========= Pestañas =========
+    def _new_doc(self, path=None):
+        return {"id": os.urandom(6).hex(), "path": path, "text": None, "tags": None, "insert": "1.0",
+                "yview": 0.0, "modified": False, "mtime": None, "diag": ({}, {}), "used": time.monotonic()}
+
+    def _find_doc(self, path):
+        for doc in self.docs:
+            if doc is self.doc:
+                if self.current_file and os.path.abspath(self.current_file) == path: return doc
+            elif doc["path"] and os.path.abspath(doc["path"]) == path:
+                return doc
+        return None
+
+    def _doc_is_blank(self):
+        # pestaña sin archivo ni cambios: se reutiliza en vez de abrir otra
+        return (not self.current_file and not self.file_modified
+                and self.editor.compare("end-1c", "==", "1.0"))
+
+    def _doc_title(self, doc):
+        path = self.current_file if doc is self.doc else doc["path"]
+        modified = self.file_modified if doc is self.doc else doc["modified"]
+        return (os.path.basename(path) if path else "sin título") + (" •" if modified else "")
+
+    def _snapshot_active(self):
+        # texto + rangos de etiquetas (tal como los devuelve Tk) comprimidos; el Text queda libre
+        doc, ed = self.doc, self.editor
+        text = ed.get('1.0', 'end-1c')
+        if self._journal_job is not None: self._journal_now(text)
+        doc["text"] = zlib.compress(text.encode("utf-8"), 1)
+        doc["tags"] = zlib.compress("\n".join(ed.tk.eval(f"{ed._w} tag ranges {t}") for t in DOC_TAGS).encode("ascii"), 1)
+        doc["insert"] = ed.index(tk.INSERT); doc["yview"] = ed.yview()[0]
+        doc["path"] = self.current_file; doc["modified"] = self.file_modified
+        doc["mtime"] = self._mtime(self.current_file) if self.current_file else None
+        doc["diag"] = (self._diag_msgs, self._diag_gutter)
+        doc["used"] = time.monotonic()
+        self._trim_snapshots()
+
+    def _trim_snapshots(self):
+        # por encima del presupuesto se descartan (LRU) las instantáneas que se pueden releer del disco
+        inactive = [d for d in self.docs if d is not self.doc and d["text"] is not None]
+        total = sum(len(d["text"]) + len(d["tags"] or b"") for d in inactive)
+        for d in sorted(inactive, key=lambda d: d["used"]):
+            if total <= DOC_SNAPSHOT_BUDGET: break
+            if d["modified"] or not d["path"]: continue
+            total -= len(d["text"]) + len(d["tags"] or b"")
+            d["text"] = d["tags"] = None
+
+    def _load_doc(self, doc):
+        ed = self.editor
+        text, cached = None, False
+        stale = doc["path"] and not doc["modified"] and self._mtime(doc["path"]) != doc["mtime"]
+        if doc["text"] is not None and not stale:
+            text, cached = zlib.decompress(doc["text"]).decode("utf-8"), True
+        elif doc["path"]:
+            try:
+                with open(doc["path"], 'r', encoding='utf-8') as f: text = f.read()
+            except Exception as e:
+                self._set_status(f"No se pudo releer {os.path.basename(doc['path'])}: {e}")
+        ed.delete('1.0', 'end'); ed.insert('1.0', text or ""); ed.edit_reset()
+        ed.edit_modified(False)  # <<Modified>> llega en cola: que no marque la pestaña como cambiada
+        self.current_file = doc["path"]
+        self.file_modified = doc["modified"] if cached else False
+        self._lint_gen += 1  # descartar diagnósticos en vuelo de la pestaña anterior
+        if cached and doc["tags"] is not None:
+            for t in DOC_TAGS: ed.tag_remove(t, "1.0", "end")
+            for t, ranges in zip(DOC_TAGS, zlib.decompress(doc["tags"]).decode("ascii").split("\n")):
+                if ranges: ed.tk.eval(f"{ed._w} tag add {t} {ranges}")
+            self._diag_msgs, self._diag_gutter = doc["diag"]
+        else:
+            self._highlight_all(); self._diag_msgs, self._diag_gutter = {}, {}
+            self._schedule_lint()
+        doc["text"] = doc["tags"] = None
+        ed.mark_set(tk.INSERT, doc["insert"] if cached else "1.0")
+        ed.yview_moveto(doc["yview"] if cached else 0.0)
+        fname = os.path.basename(doc["path"]) if doc["path"] else ""
+        if not hasattr(self, "filename_var"): self.filename_var = tk.StringVar(value="")
+        if not hasattr(self, "ext_var"): self.ext_var = tk.StringVar(value=".py")
+        self.filename_var.set(os.path.splitext(fname)[0])
+        self.ext_var.set(os.path.splitext(fname)[1] or ".py")
+        self._update_linenos(force=True)
+        self._watch_mtime = self._mtime(self.current_file) if self.current_file else None
+
+    def _follow_folder(self, folder):
+        # al abrir un archivo, el explorador pasa a su carpeta
+        if folder and folder != os.path.abspath(self.current_directory):
+            self.current_directory = folder
+            self.settings["last_dir"] = folder; save_settings(self.settings)
+            self.refresh_file_list(); self._refresh_folder_widgets(); self._refresh_subfolders()
+
+    def switch_doc(self, doc):
+        if doc is self.doc or doc not in self.docs: return
+        self._snapshot_active()
+        self.doc = doc; doc["used"] = time.monotonic()
+        self._load_doc(doc)
+        self._render_tabs()
+        self.editor.see(tk.INSERT); self.editor.focus_set()
+        self._set_status(f"Pestaña: {self._doc_title(doc)}")
+
+    def _cycle_doc(self, step):
+        if len(self.docs) > 1:
+            self.switch_doc(self.docs[(self.docs.index(self.doc) + step) % len(self.docs)])
+
+    def close_doc(self, doc):
+        if doc not in self.docs: return
+        if doc is not self.doc and doc["modified"]: self.switch_doc(doc)
+        if doc is self.doc and not self._maybe_discard_changes(mode="prompt"): return
+        idx = self.docs.index(doc)
+        self.docs.remove(doc)
+        self._journal_drop(doc)
+        if doc is not self.doc:
+            self._render_tabs(); return
+        if not self.docs: self.docs.append(self._new_doc())
+        self.doc = self.docs[min(idx, len(self.docs) - 1)]
+        self._load_doc(self.doc)
+        self._render_tabs()
+
+    def _render_tabs(self):
+        for w in self.tab_bar.winfo_children(): w.destroy()
+        for doc in self.docs:
+            active = doc is self.doc
+            bg = ACCENT if active else BTN_BG
+            fg = "#101010" if active else BTN_FG
+            tab = tk.Frame(self.tab_bar, bg=bg); tab.pack(side='left', padx=(0, 2), pady=(2, 0))
+            name = tk.Label(tab, text=self._doc_title(doc), bg=bg, fg=fg, padx=8, pady=3)
+            name.pack(side='left')
+            close = tk.Label(tab, text="×", bg=bg, fg=fg, padx=4, pady=3, cursor="hand2")
+            close.pack(side='left')
+            name.bind("<Button-1>", lambda e, d=doc: self.switch_doc(d))
+            name.bind("<Button-2>", lambda e, d=doc: self.close_doc(d))
+            close.bind("<Button-1>", lambda e, d=doc: self.close_doc(d))
+
+    # ---- Diario de edición ----
+    def _schedule_journal(self):
+        # tras una pausa de tecleo, o como mucho cada JOURNAL_MAX_MS mientras se teclea
+        now = time.monotonic()
+        if self._journal_due is None: self._journal_due = now + JOURNAL_MAX_MS / 1000
+        if self._journal_job is not None: self.root.after_cancel(self._journal_job)
+        delay = max(0, min(JOURNAL_IDLE_MS, int((self._journal_due - now) * 1000)))
+        self._journal_job = self.root.after(delay, self._journal_now)
+
+    def _journal_now(self, text=None):
+        if self._journal_job is not None: self.root.after_cancel(self._journal_job)
+        self._journal_job = self._journal_due = None
+        if not self.file_modified: return
+        # solo se copia el texto aquí; el delta y la escritura ocurren en el hilo del diario
+        self.journal.record(self.doc["id"], self.current_file,
+                            text if text is not None else self.editor.get('1.0', 'end-1c'))
+
+    def _journal_drop(self, doc):
+        if doc is self.doc and self._journal_job is not None:
+            self.root.after_cancel(self._journal_job); self._journal_job = self._journal_due = None
+        self.journal.discard(doc["id"])
+
+    def _check_leftover_journals(self):
+        found = EditJournal.leftovers()
+        if found: self.ui_calls.put(lambda: self._offer_restore(found))
+
+    def _offer_restore(self, found):
+        names = "\n".join(f"  • {os.path.basename(p) if p else 'sin título'} "
+                          f"({time.strftime('%d/%m %H:%M', time.localtime(m))})" for _, p, _, m in found[:12])
+        more = f"\n  … y {len(found) - 12} más" if len(found) > 12 else ""
+        r = messagebox.askyesnocancel(
+            "Recuperar cambios",
+            f"Hay {len(found)} documento(s) con cambios sin guardar de una sesión anterior:\n{names}{more}\n\n"
+            "Sí: restaurarlos en pestañas · No: descartarlos · Cancelar: decidir la próxima vez")
+        if r is None: return
+        if r:
+            first = None
+            for jp, path, text, _ in found:
+                doc = self._new_doc(path)
+                doc.update(text=zlib.compress(text.encode("utf-8"), 1), modified=True)
+                self.docs.append(doc)
+                self.journal.record(doc["id"], path, text)  # pasa a un diario de esta sesión
+                first = first or doc
+            if self._doc_is_blank():
+                blank = self.doc
+                self.switch_doc(first); self.docs.remove(blank)
+            self._render_tabs()
+            self._set_status(f"Restaurados {len(found)} documento(s) sin guardar")
+        for jp, _, _, _ in found: self.journal.remove_file(jp)
+
     # ========= Folder Viewer helpers =========
     def _folder_text(self):
-        try:
-            files = os.listdir(self.current_directory)
-            n = len([f for f in files if os.path.isfile(os.path.join(self.current_directory, f))])
-        except Exception:
-            n = 0
+        # usa el último escaneo; mientras no haya uno de esta carpeta muestra "…"
         base = os.path.basename(self.current_directory) or self.current_directory
-        return f"📂 {base} ({n} archivos)"
+        if self._listing and self._listing[0] == self.current_directory:
+            return f"📂 {base} ({len(self._listing[1])} archivos)"
+        return f"📂 {base} (…)"
 
     def _refresh_subfolders(self):
-        self.sub_list.delete(0, 'end')
+        self._scan_directory()
+
+    def _scan_directory(self):
+        # archivos, subcarpetas y contador salen de un único scandir en segundo plano;
+        # varias peticiones seguidas se agrupan en un solo escaneo
+        if not self._panels_ready or self._scan_job is not None: return
+        self._scan_job = self.root.after_idle(self._start_scan)
+
+    def _start_scan(self):
+        self._scan_job = None
+        self._scan_gen += 1
+        gen, d = self._scan_gen, self.current_directory
+        threading.Thread(target=self._scan_worker, args=(gen, d), daemon=True).start()
+
+    def _scan_worker(self, gen, d):
+        files, subs, err = [], [], None
         try:
-            subs = [d for d in sorted(os.listdir(self.current_directory))
-                    if os.path.isdir(os.path.join(self.current_directory, d))]
-            for s in subs: self.sub_list.insert('end', s)
-        except Exception as e:
-            self._set_status(f"Error listando subcarpetas: {e}")
+            with os.scandir(d) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(): subs.append(entry.name)
+                        elif entry.is_file(): files.append(entry.name)
+                    except OSError:
+                        continue
+        except OSError as e:
+            err = e
+        files.sort(); subs.sort()
+        self.ui_calls.put(lambda: self._apply_scan(gen, d, files, subs, err))
+
+    def _apply_scan(self, gen, d, files, subs, err):
+        if gen != self._scan_gen or d != self.current_directory: return  # llegó un escaneo más nuevo
+        self._listing = (d, files, subs)
+        shown = [f for f in files if os.path.splitext(f)[1] in DEFAULT_EXTS] if self.file_filter.get() else files
+        self.file_list.delete(0, 'end')
+        if shown: self.file_list.insert('end', *shown)
+        self.sub_list.delete(0, 'end')
+        if subs: self.sub_list.insert('end', *subs)
+        self.folder_label.config(text=self._folder_text())
+        if err is not None: self._set_status(f"Error al listar: {err}")
+        STARTUP.mark("listado de carpeta")
+        total = STARTUP.report()
+        if total is not None: self._set_status(f"Arranque: {total * 1000:.0f} ms")
 
     def _selected_subfolder(self):
         sel = self.sub_list.curselection()
@@ -552,6 +2655,7 @@ class RunPad:
             self.refresh_file_list(); self._refresh_folder_widgets(); self._refresh_subfolders()
 
     def new_subfolder(self):
+        from tkinter import simpledialog
         name = simpledialog.askstring("Nueva subcarpeta", "Nombre:", parent=self.root)
         if not name: return
         path = os.path.join(self.current_directory, name)
@@ -563,6 +2667,7 @@ class RunPad:
             messagebox.showerror("Error", f"No se pudo crear:\n{e}")
 
     def rename_selected_subfolder(self):
+        from tkinter import simpledialog
         name = self._selected_subfolder()
         if not name:
             messagebox.showinfo("Info", "Selecciona una subcarpeta."); return
@@ -575,31 +2680,18 @@ class RunPad:
             messagebox.showerror("Error", "Ya existe una carpeta con ese nombre."); return
 
         self.stop_all()
-        old_cwd = os.getcwd()
-        try:
-            os.chdir(self.current_directory)
-            for _ in range(4):
-                try:
-                    os.rename(old, new)
-                    break
-                except (PermissionError, OSError):
-                    time.sleep(0.25)
-            else:
-                raise PermissionError("El sistema mantiene la carpeta en uso.")
-        except Exception as e:
-            messagebox.showerror("Error", f"No se pudo renombrar:\n{e}\n\nCierra procesos o ventanas que usen esa carpeta.")
-            return
-        finally:
-            try: os.chdir(old_cwd)
-            except Exception: pass
-
-        if self.current_file and self.current_file.startswith(old + os.sep):
-            rel = os.path.relpath(self.current_file, old)
-            self.current_file = os.path.join(new, rel)
-        self._remap_scripts_paths(old, new)
+        self._release_cwd(old)
 
-        self._refresh_subfolders(); self.refresh_file_list()
-        self._set_status(f"Subcarpeta renombrada a: {new_name}")
+        def done(_res, err):
+            if err is not None:
+                if isinstance(err, FileOpCancelled): self._set_status(str(err)); return
+                messagebox.showerror("Error", f"No se pudo renombrar:\n{err}\n\nCierra procesos o ventanas que usen esa carpeta.")
+                return
+            self._remap_open_paths(old, new)
+            self._refresh_after_file_op()
+            self._set_status(f"Subcarpeta renombrada a: {new_name}")
+        self.file_ops.submit(f"Renombrar {name}", lambda job: _retry_rename(old, new, job), done)
+        self._set_status(f"Renombrando {name}…")
 
     def delete_selected_subfolder(self):
         name = self._selected_subfolder()
@@ -610,17 +2702,83 @@ class RunPad:
             self._refresh_subfolders(); return
         if not messagebox.askyesno("Eliminar", f"¿Eliminar subcarpeta '{name}'?"): return
         try:
-            os.rmdir(path)
+            with os.scandir(path) as it: empty = next(it, None) is None
         except OSError:
-            if messagebox.askyesno("Eliminar", "La carpeta no está vacía. ¿Eliminar recursivamente?"):
-                try: shutil.rmtree(path)
-                except Exception as e:
-                    messagebox.showerror("Error", f"No se pudo eliminar:\n{e}"); return
-            else:
-                return
-        self._refresh_subfolders(); self.refresh_file_list()
+            empty = False
+        if not empty and not messagebox.askyesno("Eliminar", "La carpeta no está vacía. ¿Eliminar recursivamente?"):
+            return
+        self._release_cwd(path)
+
+        def done(_res, err):
+            if isinstance(err, FileOpCancelled): self._set_status(f"{err} (eliminación parcial)")
+            elif err is not None: messagebox.showerror("Error", f"No se pudo eliminar:\n{err}")
+            else: self._set_status(f"Subcarpeta eliminada: {name}")
+            self._refresh_after_file_op()
+        self.file_ops.submit(f"Eliminar {name}",
+                             lambda job: _rmtree_with_progress(path, job, self.file_ops), done)
+        self._set_status(f"Eliminando {name}…")
+
+    def duplicate_selected_subfolder(self):
+        from tkinter import simpledialog
+        name = self._selected_subfolder()
+        if not name:
+            messagebox.showinfo("Info", "Selecciona una subcarpeta."); return
+        src = os.path.join(self.current_directory, name)
+        new_name = simpledialog.askstring("Duplicar subcarpeta", "Nombre de la copia:",
+                                          initialvalue=f"{name} (copia)", parent=self.root)
+        if not new_name: return
+        dst = os.path.join(self.current_directory, new_name)
+        if os.path.exists(dst):
+            messagebox.showerror("Error", "Ya existe una carpeta con ese nombre."); return
+
+        def done(_res, err):
+            if isinstance(err, FileOpCancelled): self._set_status(f"{err} (copia parcial en {new_name})")
+            elif err is not None: messagebox.showerror("Error", f"No se pudo copiar:\n{err}")
+            else: self._set_status(f"Copiada a: {new_name}")
+            self._refresh_after_file_op()
+        self.file_ops.submit(f"Copiar {name}",
+                             lambda job: _copytree_with_progress(src, dst, job, self.file_ops), done)
+        self._set_status(f"Copiando {name}…")
+
+    def cancel_file_ops(self):
+        n = self.file_ops.cancel()
+        self._set_status("Cancelando operación…" if n else "No hay operaciones de archivos en curso")
+
+    def _on_file_op_progress(self, job):
+        if job.total:
+            pct = int(job.done * 100 / job.total)
+            self._set_status(f"{job.label}: {job.done}/{job.total} ({pct}%)")
+
+    def _refresh_after_file_op(self):
+        if not os.path.isdir(self.current_directory):
+            self.current_directory = os.path.dirname(self.current_directory) or os.getcwd()
+        self._refresh_folder_widgets(); self.refresh_file_list(); self._refresh_subfolders()
+
+    def _release_cwd(self, path):
+        # el proceso no debe retener la carpeta que se va a renombrar/eliminar
+        try:
+            cwd = os.getcwd()
+            if cwd == path or cwd.startswith(path + os.sep):
+                os.chdir(os.path.dirname(path))
+        except Exception:
+            pass
+
+    def _remap_open_paths(self, old, new):
+        if self.current_file and self.current_file.startswith(old + os.sep):
+            rel = os.path.relpath(self.current_file, old)
+            self.current_file = os.path.join(new, rel)
+        for doc in self.docs:
+            if doc["path"] and doc["path"].startswith(old + os.sep):
+                doc["path"] = os.path.join(new, os.path.relpath(doc["path"], old))
+        self._render_tabs()
+        if self.current_directory == old or self.current_directory.startswith(old + os.sep):
+            rel = os.path.relpath(self.current_directory, old)
+            self.current_directory = os.path.normpath(os.path.join(new, rel))
+            self.settings["last_dir"] = self.current_directory; save_settings(self.settings)
+        self._remap_scripts_paths(old, new)
 
     def _refresh_folder_widgets(self):
+        if not self._panels_ready: return
         self.folder_label.config(text=self._folder_text())
         self.curr_name_var.set(os.path.basename(self.current_directory) or self.current_directory)
         self.path_var.set(self.current_directory)
@@ -634,6 +2792,7 @@ class RunPad:
             self.refresh_file_list(); self._refresh_folder_widgets(); self._refresh_subfolders()
 
     def make_new_folder(self):
+        from tkinter import simpledialog
         name = simpledialog.askstring("Nueva carpeta", "Nombre de la carpeta:", parent=self.root)
         if not name: return
         new = os.path.join(self.current_directory, name)
@@ -658,33 +2817,19 @@ class RunPad:
             messagebox.showerror("Error", "Ya existe una carpeta con ese nombre."); return
 
         self.stop_all()
-        old_cwd = os.getcwd()
-        try:
-            os.chdir(parent)
-            for _ in range(4):
-                try:
-                    os.rename(old_path, new_path)
-                    break
-                except (PermissionError, OSError):
-                    time.sleep(0.25)
-            else:
-                raise PermissionError("El sistema mantiene la carpeta en uso.")
-        except Exception as e:
-            messagebox.showerror("Error", f"No se pudo renombrar:\n{e}\n\nCierra ventanas del Explorador o terminales que usen esta carpeta.")
-            return
-        finally:
-            try: os.chdir(old_cwd)
-            except Exception: pass
+        self._release_cwd(old_path)
 
-        if self.current_file and self.current_file.startswith(old_path + os.sep):
-            rel = os.path.relpath(self.current_file, old_path)
-            self.current_file = os.path.join(new_path, rel)
-        self._remap_scripts_paths(old_path, new_path)
-
-        self.current_directory = new_path
-        self.settings["last_dir"] = new_path; save_settings(self.settings)
-        self._refresh_folder_widgets(); self.refresh_file_list(); self._refresh_subfolders()
-        self._set_status(f"Carpeta renombrada a: {new_name}")
+        def done(_res, err):
+            if err is not None:
+                if isinstance(err, FileOpCancelled): self._set_status(str(err)); return
+                messagebox.showerror("Error", f"No se pudo renombrar:\n{err}\n\nCierra ventanas del Explorador o terminales que usen esta carpeta.")
+                return
+            self._remap_open_paths(old_path, new_path)
+            self._refresh_after_file_op()
+            self._set_status(f"Carpeta renombrada a: {new_name}")
+        self.file_ops.submit(f"Renombrar {os.path.basename(old_path)}",
+                             lambda job: _retry_rename(old_path, new_path, job), done)
+        self._set_status("Renombrando carpeta…")
 
     def _remap_scripts_paths(self, old_root, new_root):
         new_list = []
@@ -700,6 +2845,12 @@ class RunPad:
                 new_marked.add(np)
         self.scripts_list = new_list
         self.scripts_marked = new_marked
+        for key in ("automator_limits", "automator_matrix"):
+            per_path = self.settings.get(key)
+            if per_path:
+                self.settings[key] = {(os.path.join(new_root, os.path.relpath(p, old_root))
+                                       if p.startswith(old_root + os.sep) else p): v
+                                      for p, v in per_path.items()}
         self._refresh_script_box()
         self._persist_automator()
 
@@ -727,37 +2878,45 @@ class RunPad:
         sel = self.file_list.curselection()
         if not sel: return
         fname = self.file_list.get(sel[0])
-        path = os.path.join(self.current_directory, fname)
-        if not self._maybe_discard_changes(mode="prompt"): return
-        try:
-            with open(path, 'r', encoding='utf-8') as f: txt = f.read()
+        self.open_path(os.path.join(self.current_directory, fname))
+
+    def open_path(self, path, line=None):
+        path = os.path.abspath(path)
+        open_doc = self._find_doc(path)
+        if open_doc is not None:
+            self.switch_doc(open_doc)
+        else:
+            try:
+                with open(path, 'r', encoding='utf-8') as f: txt = f.read()
+            except Exception as e:
+                messagebox.showerror("Error", str(e)); return
+            folder, fname = os.path.split(path)
+            self._follow_folder(folder)
+            if not self._doc_is_blank():
+                pos = self.docs.index(self.doc) + 1
+                self._snapshot_active()
+                self.doc = self._new_doc(); self.docs.insert(pos, self.doc)
             self.editor.delete('1.0','end'); self.editor.insert('1.0', txt)
+            self.editor.edit_reset(); self.editor.edit_modified(False)
             self.current_file = path; self.file_modified = False
+            self._diag_msgs, self._diag_gutter = {}, {}
+            self._schedule_lint()
+            self._render_tabs()
             if not hasattr(self, "filename_var"): self.filename_var = tk.StringVar(value="")
             if not hasattr(self, "ext_var"): self.ext_var = tk.StringVar(value=".py")
             self.filename_var.set(os.path.splitext(fname)[0])
             self.ext_var.set(os.path.splitext(fname)[1] or ".py")
             self._set_status(f"Abriste {fname}")
             self._update_linenos(force=True); self._highlight_all()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+            self._watch_mtime = self._mtime(path)  # como en _load_doc: abrir no es un cambio que vigilar
+        if line:
+            self.editor.mark_set(tk.INSERT, f"{line}.0"); self.editor.see(tk.INSERT)
+            self.editor.tag_remove('sel', '1.0', 'end')
+            self.editor.tag_add('sel', f"{line}.0", f"{line}.0 lineend")
+            self.editor.focus_set(); self._update_status_caret()
 
     def refresh_file_list(self):
-        self.file_list.delete(0,'end')
-        try:
-            files = sorted(os.listdir(self.current_directory))
-            for f in files:
-                p = os.path.join(self.current_directory, f)
-                if os.path.isfile(p):
-                    if self.file_filter.get():
-                        if os.path.splitext(f)[1] in DEFAULT_EXTS:
-                            self.file_list.insert('end', f)
-                    else:
-                        self.file_list.insert('end', f)
-        except Exception as e:
-            self._set_status(f"Error al listar: {e}")
-        if hasattr(self, "folder_label"):
-            self.folder_label.config(text=self._folder_text())
+        self._scan_directory()
 
     def _file_list_menu(self, event):
         idx = self.file_list.nearest(event.y)
@@ -780,6 +2939,7 @@ class RunPad:
         menu.add_command(label="Entrar", command=self.enter_selected_subfolder)
         menu.add_command(label="Renombrar", command=self.rename_selected_subfolder)
         menu.add_command(label="Eliminar", command=self.delete_selected_subfolder)
+        menu.add_command(label="Duplicar", command=self.duplicate_selected_subfolder)
         try: menu.tk_popup(event.x_root, event.y_root)
         finally: menu.grab_release()
 
@@ -840,10 +3000,13 @@ class RunPad:
 
     # ========= Automator =========
     def _refresh_script_box(self):
+        if not self._panels_ready: return
         self.script_box.delete(0, 'end')
+        matrices = self.settings.get("automator_matrix", {})
         for p in self.scripts_list:
             mark = "[x]" if p in self.scripts_marked else "[ ]"
-            self.script_box.insert('end', f"{mark} {os.path.basename(p)}")
+            extra = "  ⊞ matriz" if matrices.get(p) else ""
+            self.script_box.insert('end', f"{mark} {os.path.basename(p)}{extra}")
 
     def toggle_mark_selected(self, event=None):
         sel = self.script_box.curselection()
@@ -860,6 +3023,8 @@ class RunPad:
         self.script_box.selection_clear(0, 'end'); self.script_box.selection_set(idx)
         menu = tk.Menu(self.root, tearoff=0, bg=BG_COLOR, fg=FG_COLOR)
         menu.add_command(label="Marcar/Desmarcar", command=self.toggle_mark_selected)
+        menu.add_command(label="Límites…", command=lambda: self.edit_limits(self.scripts_list[idx]))
+        menu.add_command(label="Matriz de parámetros…", command=lambda: self.edit_matrix(self.scripts_list[idx]))
         menu.add_command(label="Quitar de la lista", command=lambda: self._remove_script(idx))
         try: menu.tk_popup(event.x_root, event.y_root)
         finally: menu.grab_release()
@@ -895,6 +3060,8 @@ class RunPad:
     def run_file(self):
         self.save_file(show_popup=False)
         if not self.current_file: return
+        # en modo vigilancia el guardado ya lanza la ejecución (_watch_trigger): no duplicarla
+        if self.watch_var.get(): return
         abs_path = os.path.abspath(self.current_file)
         ext = os.path.splitext(abs_path)[1].lower()
         if ext not in ALLOWED_EXTS:
@@ -903,6 +3070,86 @@ class RunPad:
         folder = os.path.dirname(abs_path)
         cmd_list = [sys.executable, os.path.basename(abs_path)]
         threading.Thread(target=self._run_and_stream, args=(cmd_list, folder, False, abs_path),
+                         kwargs={"limits": self._limits_for(abs_path)}, daemon=True).start()
+
+    # ---- Modo vigilancia ----
+    WATCH_DEBOUNCE_MS = 250
+    WATCH_POLL_MS = 500
+
+    def _toggle_watch(self):
+        if self.watch_var.get():
+            if not self.current_file or not _is_allowed_script(self.current_file):
+                self.watch_var.set(False)
+                messagebox.showinfo("Vigilar", "Guarda primero un archivo .py/.pyw."); return
+            self._watch_mtime = self._mtime(self.current_file)
+            self._set_status(f"Vigilando {os.path.basename(self.current_file)}")
+            self._watch_trigger()
+            # un off→on rápido no debe dejar dos bucles de sondeo
+            if self._watch_poll_job is not None: self.root.after_cancel(self._watch_poll_job)
+            self._watch_poll_job = self.root.after(self.WATCH_POLL_MS, self._watch_poll)
+        else:
+            if self._watch_poll_job is not None: self.root.after_cancel(self._watch_poll_job)
+            self._watch_poll_job = None
+            self._watch_cancel_run()
+            self._set_status("Vigilancia desactivada")
+
+    def _mtime(self, path):
+        try: return os.stat(path).st_mtime_ns
+        except OSError: return None
+
+    def _watch_poll(self):
+        self._watch_poll_job = None
+        if not self.watch_var.get(): return
+        m = self._mtime(self.current_file) if self.current_file else None
+        if m is not None and m != self._watch_mtime:
+            # cambio externo: recargar si el búfer no tiene cambios propios
+            if not self.file_modified:
+                try:
+                    with open(self.current_file, 'r', encoding='utf-8') as f: txt = f.read()
+                    if txt != self.editor.get('1.0', 'end-1c'):
+                        ed = self.editor
+                        pos = ed.index(tk.INSERT)
+                        ed.delete('1.0', 'end'); ed.insert('1.0', txt); ed.edit_reset()
+                        ed.edit_modified(False)  # como en _load_doc: el <<Modified>> en cola no es un cambio propio
+                        ed.mark_set(tk.INSERT, pos); self.file_modified = False
+                        self._lint_gen += 1
+                        self._update_linenos(force=True); self._highlight_all()
+                        self._diag_msgs, self._diag_gutter = {}, {}
+                        self._schedule_lint()
+                except Exception:
+                    pass
+            self._watch_trigger()
+        self._watch_poll_job = self.root.after(self.WATCH_POLL_MS, self._watch_poll)
+
+    def _watch_trigger(self):
+        # ráfagas de guardados → una sola ejecución
+        self._watch_mtime = self._mtime(self.current_file) if self.current_file else None
+        if self._watch_job is not None: self.root.after_cancel(self._watch_job)
+        self._watch_job = self.root.after(self.WATCH_DEBOUNCE_MS, self._watch_run)
+
+    def _watch_cancel_run(self):
+        with self.proc_lock:
+            self._watch_gen += 1
+            p, self._watch_proc = self._watch_proc, None
+        if p is not None:
+            threading.Thread(target=self.supervisor.terminate, args=(p, 1.0), daemon=True).start()
+
+    def _watch_run(self):
+        self._watch_job = None
+        if not self.watch_var.get() or not self.current_file or not _is_allowed_script(self.current_file): return
+        self._watch_cancel_run()
+        gen = self._watch_gen
+        abs_path = os.path.abspath(self.current_file)
+        self.output_queue.put(CLEAR_CONSOLE)
+        self._set_status(f"Vigilando {os.path.basename(abs_path)} · ejecución #{gen}")
+        def on_spawn(p):
+            with self.proc_lock:
+                current = gen == self._watch_gen
+                if current: self._watch_proc = p
+            if not current: threading.Thread(target=self.supervisor.terminate, args=(p, 1.0), daemon=True).start()
+        threading.Thread(target=self._run_and_stream,
+                         args=([sys.executable, os.path.basename(abs_path)], os.path.dirname(abs_path), False, abs_path),
+                         kwargs={"limits": self._limits_for(abs_path), "scope": gen, "on_spawn": on_spawn},
                          daemon=True).start()
 
     def run_python_current(self):
@@ -914,8 +3161,11 @@ class RunPad:
             messagebox.showinfo("Python ▶", "El archivo activo no es .py/.pyw."); return
         self.run_file()
 
-    def run_scripts_list(self):
-        candidates = list(self.scripts_marked) if self.scripts_marked else list(self.scripts_list)
+    def _automator_candidates(self):
+        return [p for p in self.scripts_list if p in self.scripts_marked] if self.scripts_marked else list(self.scripts_list)
+
+    def run_scripts_list(self, paths=None):
+        candidates = list(paths) if paths is not None else self._automator_candidates()
         existing = [p for p in candidates if os.path.exists(p) and _is_allowed_script(p)]
         missing = [p for p in candidates if not os.path.exists(p)]
         invalid = [p for p in candidates if os.path.exists(p) and not _is_allowed_script(p)]
@@ -925,56 +3175,933 @@ class RunPad:
             self.output_queue.put("\n[No ejecutables (permitidos: .py, .pyw):\n  - " + "\n  - ".join(invalid) + "]\n")
         if not existing:
             self.output_queue.put("\n[No hay scripts válidos para ejecutar]\n"); return
-        with self.proc_lock:
-            self._batch_results = []; self._pending = len(existing)
-        self.output_queue.put(f"\n=== Ejecutando {len(existing)} script(s) ===\n")
-        for item in existing:
-            folder = os.path.dirname(item)
-            cmd_list = [sys.executable, os.path.basename(item)]
-            threading.Thread(target=self._run_and_stream, args=(cmd_list, folder, False, item),
-                             daemon=True).start()
+        jobs = []
+        for p in existing: jobs.extend(self._make_jobs(p))
+        self._launch_batch(existing, jobs)
+
+    def _launch_batch(self, scripts, jobs, **start):
+        if not self.preflight_var.get():
+            self._start_batch(jobs, **start); return
+        self.output_queue.put(f"\n[Verificando sintaxis de {len(scripts)} script(s) e importaciones locales…]\n")
+        threading.Thread(target=self._preflight_then_start, args=(scripts, jobs), kwargs=start, daemon=True).start()
+
+    def _preflight_then_start(self, scripts, jobs, **start):
+        t0 = time.monotonic()
+        try:
+            errors, checked = _preflight_batch(scripts)
+        except Exception as e:
+            self.output_queue.put(f"\n[Verificación omitida: {e}]\n"); errors, checked = [], 0
+        if errors:
+            self.output_queue.put(f"\n== {len(errors)} error(es) de sintaxis; el lote no se ejecuta ==\n")
+            for path, line, col, msg in errors:
+                self.output_queue.put((f"{path}:{line}:{col}", (path, line)))
+                self.output_queue.put(f"  {msg}\n")
+            self.ui_calls.put(lambda: self._set_status(f"Lote cancelado: {len(errors)} error(es) de sintaxis"))
+            return
+        self.output_queue.put(f"[Sintaxis OK: {checked} archivo(s) en {time.monotonic() - t0:.2f}s]\n")
+        self._start_batch(jobs, **start)
 
-    def stop_all(self):
+    def run_affected(self):
+        candidates = [p for p in self._automator_candidates() if _is_allowed_script(p)]
+        if not candidates:
+            self.output_queue.put("\n[No hay scripts válidos para ejecutar]\n"); return
+        self._set_status("Analizando importaciones…")
+        threading.Thread(target=self._find_affected, args=(candidates,), daemon=True).start()
+
+    def _find_affected(self, candidates):
+        try:
+            # un script con matriz cuenta como correcto solo si todas sus combinaciones lo fueron
+            keys = {}
+            for p in candidates:
+                spec = self.settings.get("automator_matrix", {}).get(p)
+                variants = [c["key"] for c in _expand_matrix(p, spec)] if spec else []
+                keys[p] = [(os.path.abspath(p), v) for v in variants or [None]]
+            last_ok = self.history.last_success({k for ks in keys.values() for k in ks}) if self.history else {}
+            affected, report = [], []
+            for p in candidates:
+                times = [last_ok.get(k) for k in keys[p]]
+                since = None if None in times else min(times)
+                changed = _changed_since(self.import_graph.closure(p), since)
+                if changed:
+                    affected.append(p)
+                    why = "sin ejecución correcta previa" if since is None else \
+                        "cambió: " + ", ".join(os.path.basename(c) for c in changed[:5]) + (" …" if len(changed) > 5 else "")
+                    report.append(f"  - {os.path.basename(p)} ({why})")
+            self.import_graph.save()
+        except Exception as e:
+            self.output_queue.put(f"\n[Error analizando importaciones: {e}]\n"); return
+        skipped = len(candidates) - len(affected)
+        if not affected:
+            self.output_queue.put(f"\n[Sin cambios desde la última ejecución correcta: {skipped} script(s) omitidos]\n")
+            self.ui_calls.put(lambda: self._set_status("Nada que ejecutar")); return
+        self.output_queue.put(f"\n[Afectados {len(affected)}/{len(candidates)}:\n" + "\n".join(report) + "]\n")
+        self.ui_calls.put(lambda: self.run_scripts_list(affected))
+
+    def _make_jobs(self, path):
+        base = {"label": path, "cmd": [sys.executable, os.path.basename(path)],
+                "cwd": os.path.dirname(path), "limits": self._limits_for(path), "expected": None}
+        spec = self.settings.get("automator_matrix", {}).get(path)
+        if not spec: return [base]
+        jobs = []
+        for combo in _expand_matrix(path, spec):
+            job = dict(base, cmd=base["cmd"] + combo["argv"], env=combo["env"], matrix=combo["key"])
+            job["display"] = f"{os.path.basename(path)} [{combo['key']}]"
+            jobs.append(job)
+        if not jobs:
+            self.output_queue.put(f"\n[Matriz sin combinaciones: {os.path.basename(path)}]\n")
+        return jobs
+
+    def _batch_concurrency(self):
+        return max(1, int(self.settings.get("batch_concurrency") or os.cpu_count() or 4))
+
+    def set_batch_concurrency(self):
+        from tkinter import simpledialog
+        n = simpledialog.askinteger("Concurrencia del lote", "Scripts en paralelo:",
+                                    initialvalue=self._batch_concurrency(), minvalue=1, maxvalue=256,
+                                    parent=self.root)
+        if n:
+            self.settings["batch_concurrency"] = n; save_settings(self.settings)
+            self._set_status(f"Concurrencia del lote: {n}")
+
+    def _start_batch(self, jobs, concurrency=None, carried=()):
+        if self.history is not None:
+            try:
+                key = lambda j: (os.path.abspath(j["label"]), j.get("matrix"))
+                expected = self.history.expected_durations({key(j) for j in jobs})
+                for j in jobs: j["expected"] = expected.get(key(j))
+            except Exception:
+                pass
+        batch = BatchRun(jobs, concurrency or self._batch_concurrency(), checkpoint=BATCH_PATH, carried=carried,
+                         source_hash=self._source_hash)
+        with self.proc_lock: self._batch = batch
+        if carried:
+            self.output_queue.put(f"\n=== Reanudando lote: {len(jobs)} script(s) pendientes, {len(carried)} ya correctos, "
+                                  f"{batch.concurrency} en paralelo ===\n")
+        else:
+            self.output_queue.put(f"\n=== Ejecutando {len(jobs)} script(s), {batch.concurrency} en paralelo ===\n")
+        batch.save()
+        threading.Thread(target=self._dispatch_batch, args=(batch,), daemon=True).start()
+
+    def resume_batch(self):
         with self.proc_lock:
-            for p in self.running_procs:
+            batch = getattr(self, "_batch", None)
+        if batch is not None and len(batch.results) < len(batch.jobs):
+            messagebox.showinfo("Reanudar lote", "Hay un lote en curso."); return
+        ckpt = _load_batch_checkpoint()
+        if not ckpt or not ckpt.get("jobs"):
+            messagebox.showinfo("Reanudar lote", "No hay ningún lote guardado."); return
+        self._set_status("Comprobando el lote guardado…")
+        threading.Thread(target=self._resume_worker, args=(ckpt,), daemon=True).start()
+
+    def _source_hash(self, path):
+        return _closure_sha1(self.import_graph, path)
+
+    def _resume_worker(self, ckpt):
+        rerun, keep, missing, changed = _resume_plan(ckpt, self._source_hash)
+        self.import_graph.save()
+        if missing:
+            self.output_queue.put("\n[Ya no existen (se omiten):\n  - " + "\n  - ".join(missing) + "]\n")
+        if not rerun:
+            self.output_queue.put(f"\n[Lote guardado completo: {len(keep)} correcto(s), nada que reanudar]\n")
+            self.ui_calls.put(lambda: self._set_status("Nada que reanudar")); return
+        if changed:
+            self.output_queue.put(f"\n[{changed} correcto(s) se repiten porque su script o sus importaciones cambiaron]\n")
+        scripts = list(dict.fromkeys(j["label"] for j in rerun))
+        self.ui_calls.put(lambda: self._launch_batch(scripts, rerun, concurrency=ckpt.get("concurrency"), carried=keep))
+
+    def _check_saved_batch(self):
+        # al arrancar: avisa si el último lote quedó a medias (detenido o cierre inesperado); un lote
+        # que terminó con fallos ya mostró su resumen y sigue pudiéndose reanudar desde el menú
+        ckpt = _load_batch_checkpoint()
+        if not ckpt: return
+        left = sum(1 for e in ckpt.get("jobs", []) if e.get("state") in ("pending", "cancelled"))
+        if left:
+            text = f"Lote anterior con {left} script(s) sin completar: Ejecutar ▸ Reanudar lote"
+            self.ui_calls.put(lambda: self._set_status(text))
+
+    def _dispatch_batch(self, batch):
+        free = {None: batch.concurrency}   # None = local; AgentClient → slots libres
+        for client, n in self._batch_agents(): free[client] = n
+        batch.concurrency = sum(free.values())
+        cond = threading.Condition()
+
+        def acquire():
+            with cond:
+                cond.wait_for(lambda: any(n > 0 for n in free.values()))
+                # el ejecutor con más slots libres; a igualdad, el local
+                ex = max(free, key=lambda k: (free[k], k is None))
+                free[ex] -= 1
+                return ex
+
+        def acquire_local():
+            with cond:
+                cond.wait_for(lambda: free[None] > 0)
+                free[None] -= 1
+
+        def release(ex, drop=False):
+            with cond:
+                if drop: free.pop(ex, None)
+                elif ex in free: free[ex] += 1
+                cond.notify_all()   # el despachador y los trabajos que esperan un slot local
+
+        threads = []
+        self._post_batch_eta(batch)
+        for job in batch.jobs:
+            ex = acquire()
+            if batch.stop.is_set():
+                release(ex); batch.finish(job, None, 0.0); continue
+            batch.mark_started(job)
+            t = threading.Thread(target=self._run_batch_job, args=(batch, job, ex, release, acquire_local),
+                                 daemon=True)
+            t.start(); threads.append(t)
+        for t in threads: t.join()
+        self.import_graph.save()
+        self.output_queue.put(batch.summary())
+        total = _fmt_secs(time.monotonic() - batch.t0)
+        self.ui_calls.put(lambda: self._set_status(f"Lote terminado en {total}"))
+
+    def _run_batch_job(self, batch, job, executor, release, acquire_local):
+        code = None; t0 = time.monotonic(); cancelled = False
+        try:
+            if executor is not None:
                 try:
-                    if os.name == "nt":
-                        subprocess.Popen(f"taskkill /F /T /PID {p.pid}", shell=True)
+                    code = self._run_remote(executor, job)
+                except (OSError, ValueError) as e:
+                    if batch.stop.is_set():
+                        # Detener cortó la conexión antes del arranque: no se corre en local
+                        cancelled = True; return
+                    # no llegó a empezar en el agente: el agente sale del lote y el trabajo espera
+                    # un slot local, para no pasar de la concurrencia local
+                    self.output_queue.put(f"\n[Agente {executor.label} no disponible ({e}); "
+                                          f"{os.path.basename(job['label'])} se ejecuta en local]\n")
+                    release(executor, True); executor = None
+                    acquire_local()
+                    if batch.stop.is_set():
+                        cancelled = True; return
+            if code is None:
+                code = self._run_and_stream(job["cmd"], job["cwd"], False, job["label"], limits=job["limits"],
+                                            env=job.get("env"), display=job.get("display"),
+                                            buffered=bool(job.get("matrix")), variant=job.get("matrix"))
+        finally:
+            batch.finish(job, None if cancelled else code if code is not None else -1, time.monotonic() - t0)
+            release(executor)
+            self._post_batch_eta(batch)
+
+    # ---- Agentes remotos ----
+    def _agent_clients(self):
+        return [AgentClient(a["host"], a.get("port", AGENT_PORT), a.get("token", ""))
+                for a in self.settings.get("agents", [])]
+
+    def _batch_agents(self):
+        # agentes configurados que responden → [(AgentClient, slots libres)]
+        if not self.settings.get("use_agents"): return []
+        out = []
+        for client in self._agent_clients():
+            try:
+                hello = client.probe()
+            except (OSError, ValueError) as e:
+                self.output_queue.put(f"[Agente {client.label} no disponible: {e}]\n"); continue
+            free = int(hello.get("free") or 0)
+            self.output_queue.put(f"[Agente {client.label} ({hello.get('host')}): "
+                                  f"{free}/{hello.get('slots')} slots libres]\n")
+            if free > 0: out.append((client, free))
+        return out
+
+    def _track_remote(self, sock, add):
+        with self.proc_lock:
+            if add: self._remote_socks.add(sock)
+            else: self._remote_socks.discard(sock)
+
+    def _run_remote(self, client, job):
+        # como _run_and_stream, pero en un agente; lanza OSError/ValueError solo si el agente no
+        # confirmó el arranque ({"started"}): después, un corte cuenta como fallo, no se repite
+        label, display = job["label"], job.get("display")
+        argv = [AGENT_PYTHON if a == sys.executable else a for a in job["cmd"]]
+        socks = []
+        msgs = client.run({"argv": argv, "cwd": job["cwd"], "env": job.get("env") or {}, "limits": job["limits"]},
+                          on_connect=lambda s: (socks.append(s), self._track_remote(s, True)))
+        try:
+            first = next(msgs)
+            if not first.get("started"):
+                raise ConnectionError(first.get("error") or ("sin slots libres" if first.get("busy")
+                                                             else "el agente no confirmó el arranque"))
+        except BaseException:
+            msgs.close()
+            for sk in socks: self._track_remote(sk, False)
+            raise
+        job["agent"] = client.label
+        chunks = []
+        head = " ".join(job["cmd"])
+        script = os.path.abspath(label)
+        put = lambda x: self.output_queue.put((x, script))
+        emit = chunks.append if job.get("matrix") else put
+        started = time.time(); t0 = time.monotonic()
+        code = None; usage = None; log = None
+        try:
+            emit(f"\n> Ejecutando en agente {client.label}: {job['cwd']}\n> Comando: {head}\n")
+            if job.get("env"): emit("> Entorno: " + " ".join(f"{k}={v}" for k, v in job["env"].items()) + "\n")
+            log = self._open_run_log(script, started)
+            for msg in msgs:
+                if "out" in msg:
+                    emit(msg["out"])
+                    if log: log.write(msg["out"])
+                elif "exit" in msg:
+                    code, usage = msg["exit"], msg.get("usage")
+                    if msg.get("timed_out"):
+                        status = f"TIEMPO AGOTADO ({job['limits'].get('timeout')} s)"
                     else:
-                        p.terminate()
-                except Exception:
-                    pass
-            self.running_procs.clear()
-        self.output_queue.put("\n[Procesos detenidos]\n")
+                        status = "OK" if code == 0 else f"FALLÓ ({_describe_exit(code)})"
+                    emit(f"\n[{status}] {display or os.path.basename(label)} @{client.label}\n")
+                elif "error" in msg:
+                    raise ConnectionError(msg["error"])
+            if code is None: raise ConnectionError("el agente cerró la conexión")
+        except Exception as e:
+            code = -1; emit(f"\n[Error en agente {client.label}: {e}]\n")
+        finally:
+            msgs.close()
+            for sk in socks: self._track_remote(sk, False)
+            if log:
+                try: log.close()
+                except Exception: pass
+            if job.get("matrix"):
+                put(f"\n──── {display or head} @{client.label} ────" + "".join(chunks))
+            self._record_run(script, label, started, time.monotonic() - t0, code, usage,
+                             log.name if log else None, job.get("matrix"))
+        return code
+
+    def edit_agents(self):
+        win = tk.Toplevel(self.root); win.title("Agentes remotos"); win.configure(bg=BG_COLOR)
+        tk.Label(win, text="Un agente por línea: host[:puerto] [token]  (sin token: RUNPAD_AGENT_TOKEN)",
+                 bg=BG_COLOR, fg=FG_COLOR, anchor='w').pack(fill='x', padx=6, pady=(6,0))
+        tk.Label(win, text=f"En cada máquina: python runpad-pro.py --agent --token SECRETO --slots N "
+                           f"(puerto {AGENT_PORT} por defecto)",
+                 bg=BG_COLOR, fg=ACCENT_2, anchor='w').pack(fill='x', padx=6)
+        box = tk.Text(win, width=64, height=8, bg=PANEL_BG, fg=FG_COLOR, insertbackground=FG_COLOR,
+                      relief="flat", font=("Consolas", 10))
+        box.pack(fill='both', expand=True, padx=6, pady=4)
+        box.insert('1.0', "\n".join(f"{a['host']}:{a.get('port', AGENT_PORT)}" + (f" {a['token']}" if a.get("token") else "")
+                                    for a in self.settings.get("agents", [])))
+        result = tk.Label(win, text="", bg=BG_COLOR, fg=ACCENT_2, anchor='w', justify='left')
+        result.pack(fill='x', padx=6)
+
+        def parse():
+            agents = []
+            for line in box.get('1.0', 'end-1c').splitlines():
+                parts = line.split()
+                if not parts: continue
+                host, _, port = parts[0].rpartition(":") if ":" in parts[0] else (parts[0], "", "")
+                try: port = int(port) if port else AGENT_PORT
+                except ValueError: raise ValueError(f"Puerto no válido: {parts[0]}")
+                agents.append({"host": host, "port": port, **({"token": parts[1]} if len(parts) > 1 else {})})
+            return agents
+
+        def probe():
+            try: agents = parse()
+            except ValueError as e: result.config(text=str(e)); return
+            result.config(text="Probando…")
+            def worker():
+                lines = []
+                for a in agents:
+                    client = AgentClient(a["host"], a["port"], a.get("token", ""))
+                    try:
+                        h = client.probe()
+                        lines.append(f"✔ {client.label}: {h.get('host')} · {h.get('free')}/{h.get('slots')} slots libres")
+                    except (OSError, ValueError) as e:
+                        lines.append(f"✖ {client.label}: {e}")
+                text = "\n".join(lines) or "Sin agentes"
+                self.ui_calls.put(lambda: win.winfo_exists() and result.config(text=text))
+            threading.Thread(target=worker, daemon=True).start()
+
+        def save():
+            try: agents = parse()
+            except ValueError as e: messagebox.showerror("Agentes", str(e), parent=win); return
+            self.settings["agents"] = agents; save_settings(self.settings); win.destroy()
+        row = tk.Frame(win, bg=BG_COLOR); row.pack(fill='x', padx=6, pady=6)
+        self._btn(row, "Guardar", save).pack(side='left', padx=4)
+        self._btn(row, "Probar", probe).pack(side='left', padx=4)
+
+    def _post_batch_eta(self, batch):
+        with batch.lock:
+            done, total = len(batch.results), len(batch.jobs)
+        if done >= total: return
+        eta = batch.eta()
+        text = f"Lote: {done}/{total} terminados · ETA " + (_fmt_secs(eta) if eta is not None else "?")
+        self.ui_calls.put(lambda: self._set_status(text))
 
-    def _run_and_stream(self, cmd, cwd, use_shell, label=None):
-        code = None
+    def stop_all(self):
+        with self.proc_lock:
+            batch = getattr(self, "_batch", None)
+        if batch is not None and len(batch.results) < len(batch.jobs):
+            batch.stop.set()
+            self.output_queue.put("\n[Lote detenido: «Reanudar lote» continúa desde aquí]\n")
+        with self.proc_lock:
+            remote = list(self._remote_socks)
+        for sock in remote:
+            # el agente mata el proceso al ver cerrada la conexión
+            import socket
+            try: sock.shutdown(socket.SHUT_RDWR)
+            except OSError: pass
+        if remote: self.output_queue.put(f"\n[Trabajos remotos cancelados: {len(remote)}]\n")
+        procs = self.supervisor.running()
+        if not procs:
+            self.output_queue.put("\n[Procesos detenidos]\n"); return
+        def worker():
+            n = self.supervisor.terminate_all(procs)
+            self.output_queue.put(f"\n[Procesos detenidos: {n}]\n")
+        threading.Thread(target=worker, daemon=True).start()
+
+    # ---- Límites por ejecución ----
+    def _limits_for(self, path):
+        limits = dict(DEFAULT_LIMITS)
+        limits.update(self.settings.get("limits_default", {}))
+        if path: limits.update(self.settings.get("automator_limits", {}).get(path, {}))
+        return limits
+
+    def edit_limits(self, path):
+        title = f"Límites: {os.path.basename(path)}" if path else "Límites por defecto"
+        current = self._limits_for(path)
+        win = tk.Toplevel(self.root); win.title(title); win.configure(bg=BG_COLOR)
+        win.resizable(False, False)
+        fields = [("timeout", "Tiempo máximo (s):"), ("cpu", "CPU máx. (s):"), ("mem_mb", "Memoria máx. (MB):")]
+        vars_ = {}
+        for r, (key, text) in enumerate(fields):
+            tk.Label(win, text=text, bg=BG_COLOR, fg=FG_COLOR).grid(row=r, column=0, padx=6, pady=4, sticky='e')
+            vars_[key] = tk.StringVar(value=str(current.get(key) or 0))
+            tk.Entry(win, textvariable=vars_[key], width=10, bg=PANEL_BG, fg=FG_COLOR,
+                     insertbackground=FG_COLOR, relief="flat").grid(row=r, column=1, padx=6, pady=4)
+        tk.Label(win, text="0 = sin límite. CPU/memoria solo en Linux/macOS.",
+                 bg=BG_COLOR, fg="#9e9e9e").grid(row=len(fields), column=0, columnspan=2, padx=6)
+        def save():
+            try:
+                values = {k: max(0.0, float(v.get() or 0)) for k, v in vars_.items()}
+            except ValueError:
+                messagebox.showerror("Error", "Valores numéricos inválidos.", parent=win); return
+            values["cpu"] = int(values["cpu"]); values["mem_mb"] = int(values["mem_mb"])
+            if path:
+                self.settings.setdefault("automator_limits", {})[path] = values
+            else:
+                self.settings["limits_default"] = values
+            save_settings(self.settings)
+            self._set_status(f"{title} guardados"); win.destroy()
+        tk.Button(win, text="Guardar", command=save, bg=BTN_BG, fg=BTN_FG, activebackground=BTN_ACTIVE,
+                  relief="flat").grid(row=len(fields) + 1, column=0, columnspan=2, padx=6, pady=6, sticky='we')
+
+    def edit_matrix(self, path):
+        import shlex
+        spec = self.settings.get("automator_matrix", {}).get(path, {})
+        win = tk.Toplevel(self.root); win.title(f"Matriz: {os.path.basename(path)}"); win.configure(bg=BG_COLOR)
+        lbl = dict(bg=BG_COLOR, fg=FG_COLOR, anchor='w')
+        txt = dict(width=60, height=6, bg=PANEL_BG, fg=FG_COLOR, insertbackground=FG_COLOR,
+                   relief="flat", font=("Consolas", 10))
+        tk.Label(win, text="Argumentos (una combinación por línea):", **lbl).pack(fill='x', padx=6, pady=(6,0))
+        args_txt = tk.Text(win, **txt); args_txt.pack(fill='x', padx=6)
+        args_txt.insert('1.0', "\n".join(shlex.join(a) for a in spec.get("args", [])))
+        tk.Label(win, text="Variables de entorno (CLAVE=v1,v2 por línea):", **lbl).pack(fill='x', padx=6, pady=(6,0))
+        env_txt = tk.Text(win, **txt); env_txt.pack(fill='x', padx=6)
+        env_txt.insert('1.0', "\n".join(f"{k}={','.join(v)}" for k, v in spec.get("env", {}).items()))
+        tk.Label(win, text="Archivos de entrada (glob relativo al script, se añade como último argumento):",
+                 **lbl).pack(fill='x', padx=6, pady=(6,0))
+        glob_var = tk.StringVar(value=spec.get("glob", ""))
+        tk.Entry(win, textvariable=glob_var, bg=PANEL_BG, fg=FG_COLOR, insertbackground=FG_COLOR,
+                 relief="flat").pack(fill='x', padx=6)
+        count_lbl = tk.Label(win, text="", bg=BG_COLOR, fg=ACCENT_2, anchor='w')
+        count_lbl.pack(fill='x', padx=6, pady=4)
+
+        def parse():
+            args = [shlex.split(l) for l in args_txt.get('1.0', 'end-1c').splitlines() if l.strip()]
+            env = {}
+            for l in env_txt.get('1.0', 'end-1c').splitlines():
+                if not l.strip(): continue
+                if "=" not in l: raise ValueError(f"Falta '=' en: {l}")
+                k, v = l.split("=", 1)
+                env[k.strip()] = [x.strip() for x in v.split(",")]
+            return {k: v for k, v in (("args", args), ("env", env), ("glob", glob_var.get().strip())) if v}
+
+        def preview(_e=None):
+            try: n = len(_expand_matrix(path, parse()))
+            except ValueError as e: count_lbl.config(text=str(e)); return
+            count_lbl.config(text=f"{n} combinación(es)")
+        for w in (args_txt, env_txt): w.bind("<KeyRelease>", preview)
+        glob_var.trace_add("write", lambda *_: preview())
+        preview()
+
+        def store(new_spec):
+            matrices = self.settings.setdefault("automator_matrix", {})
+            if new_spec: matrices[path] = new_spec
+            else: matrices.pop(path, None)
+            save_settings(self.settings); self._refresh_script_box(); win.destroy()
+        def save():
+            try: store(parse())
+            except ValueError as e: messagebox.showerror("Matriz", str(e), parent=win)
+        row = tk.Frame(win, bg=BG_COLOR); row.pack(fill='x', padx=6, pady=6)
+        self._btn(row, "Guardar", save).pack(side='left', padx=4)
+        self._btn(row, "Quitar matriz", lambda: store(None)).pack(side='left', padx=4)
+
+    def _run_and_stream(self, cmd, cwd, use_shell, label=None, limits=None, env=None,
+                        display=None, buffered=False, scope=None, on_spawn=None, variant=None):
+        # buffered: la salida se emite en un solo bloque al terminar (combinaciones de matriz)
+        # variant: clave de la combinación de matriz, para el historial
+        # scope: generación de vigilancia; la salida de ejecuciones obsoletas se descarta
+        code = None; p = None; usage = None; log = None
+        chunks = []
+        head = cmd if isinstance(cmd, str) else " ".join(cmd)
+        script = os.path.abspath(label) if label else head
+        put = lambda x: self.output_queue.put((x, script))
+        if buffered: emit = chunks.append
+        elif scope is not None: emit = lambda x: scope == self._watch_gen and put(x)
+        else: emit = put
+        started = time.time(); t0 = time.monotonic()
         try:
-            head = cmd if isinstance(cmd, str) else " ".join(cmd)
-            self.output_queue.put(f"\n> Ejecutando en: {cwd}\n> Comando: {head}\n")
-            p = subprocess.Popen(cmd, cwd=cwd, shell=use_shell,
-                                 stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-            with self.proc_lock: self.running_procs.append(p)
-            for line in p.stdout: self.output_queue.put(line)
-            p.wait(); code = p.returncode
-            tag = os.path.basename(label) if label else head
-            status = "OK" if code == 0 else f"FALLÓ ({code})"
-            self.output_queue.put(f"\n[{status}] {tag}\n")
+            emit(f"\n> Ejecutando en: {cwd}\n> Comando: {head}\n")
+            if env: emit("> Entorno: " + " ".join(f"{k}={v}" for k, v in env.items()) + "\n")
+            log = self._open_run_log(script, started)
+            p = self.supervisor.spawn(cmd, cwd, shell=use_shell, limits=limits,
+                                      env=dict(os.environ, **env) if env else None,
+                                      stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            if on_spawn: on_spawn(p)
+            # por trozos, no por líneas: las barras de progreso con \r llegan sin esperar un \n
+            decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False) or "utf-8")(errors="replace")
+            read = getattr(p.stdout, "read1", p.stdout.read)
+            while True:
+                data = read(65536)
+                text = decoder.decode(data, final=not data)
+                if text:
+                    emit(text)
+                    if log: log.write(text)
+                if not data: break
+            code, usage = self.supervisor.wait(p)
+            tag = display or (os.path.basename(label) if label else head)
+            if p.timed_out:
+                status = f"TIEMPO AGOTADO ({limits.get('timeout')} s)"
+            else:
+                status = "OK" if code == 0 else f"FALLÓ ({_describe_exit(code)})"
+            emit(f"\n[{status}] {tag}\n")
         except Exception as e:
-            code = -1; self.output_queue.put(f"\n[Error: {e}]\n")
+            code = -1; emit(f"\n[Error: {e}]\n")
         finally:
-            with self.proc_lock:
-                try: self.running_procs.remove(p)
+            if p is not None: self.supervisor.release(p)
+            if log:
+                try: log.close()
                 except Exception: pass
-                if label is not None and hasattr(self, "_pending"):
-                    self._batch_results.append((label, code)); self._pending -= 1
-                    if self._pending == 0:
-                        ok = [os.path.basename(l) for l,c in self._batch_results if c == 0]
-                        fail = [os.path.basename(l) for l,c in self._batch_results if c != 0]
-                        summary = "\n== Resumen de ejecución ==\n"
-                        summary += f"OK ({len(ok)}): " + (", ".join(ok) if ok else "ninguno") + "\n"
-                        summary += f"FALLÓ ({len(fail)}): " + (", ".join(fail) if fail else "ninguno") + "\n"
-                        self.output_queue.put(summary)
+            if buffered:
+                put(f"\n──── {display or head} ────" + "".join(chunks))
+            self._record_run(script, label, started, time.monotonic() - t0, code, usage,
+                             log.name if log else None, variant)
+        return code
+
+    # ========= Historial =========
+    def _open_run_log(self, script, started):
+        try:
+            os.makedirs(LOGS_DIR, exist_ok=True)
+            stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(started))
+            name = f"{stamp}-{int(started * 1000) % 1000:03d}_{os.path.basename(script)}.log.gz"
+            return RunLog(os.path.join(LOGS_DIR, name))
+        except Exception:
+            return None
+
+    def _record_run(self, script, label, started, duration, code, usage, log_path, variant=None):
+        if self.history is None: return
+        try:
+            self.history.record(script=script, sha1=_file_sha1(label) if label else None,
+                                started=started, ended=started + duration, duration=duration,
+                                exit_code=code, log_path=log_path, variant=variant, **(usage or {}))
+        except Exception as e:
+            self.output_queue.put(f"\n[Historial: {e}]\n")
+
+    # ========= Latencia de la interfaz =========
+    def _toggle_latency(self):
+        UI_LATENCY.enabled = self.latency_var.get()
+        self.settings["ui_latency"] = UI_LATENCY.enabled; save_settings(self.settings)
+
+    def toggle_latency_panel(self):
+        if self._latency_win is not None and self._latency_win.winfo_exists():
+            self._latency_win.destroy(); self._latency_win = None; return
+        if not UI_LATENCY.enabled:
+            self.latency_var.set(True); self._toggle_latency()
+        win = self._latency_win = tk.Toplevel(self.root)
+        win.title("Latencia de la interfaz"); win.configure(bg=BG_COLOR); win.geometry("820x360")
+        win.attributes("-topmost", True)
+        top = tk.Frame(win, bg=BG_COLOR); top.pack(fill='x', padx=6, pady=6)
+        order = tk.StringVar(value="max")
+        for text, key in (("Máximo", "max"), ("Total", "total"), ("Bloqueos", "slow")):
+            tk.Radiobutton(top, text=text, variable=order, value=key, bg=BG_COLOR, fg=FG_COLOR,
+                           selectcolor=BTN_BG, activebackground=BG_COLOR).pack(side='left', padx=4)
+        self._btn_sm(top, "Reiniciar", UI_LATENCY.reset).pack(side='right', padx=3)
+        self._btn_sm(top, "Exportar traza…", self.export_latency_trace).pack(side='right', padx=3)
+        legend = " ".join(f"<{b:g}" for b in LATENCY_BUCKETS_MS) + f" ≥{LATENCY_BUCKETS_MS[-1]:g}"
+        tk.Label(win, text=f"Histograma por cubos (ms): {legend}", bg=BG_COLOR, fg=ACCENT_2,
+                 anchor='w').pack(fill='x', padx=6)
+        txt = tk.Text(win, bg=EDITOR_BG, fg=FG_COLOR, font=("Consolas", 10), relief="flat", wrap='none')
+        txt.pack(fill='both', expand=True, padx=6, pady=(0,6))
+        txt.tag_configure("head", foreground=ACCENT)
+        txt.tag_configure("slow", foreground="#ff5f56")
+        bars = " ▁▂▃▄▅▆▇█"
+
+        def refresh():
+            if not win.winfo_exists(): return
+            txt.delete('1.0', 'end')
+            txt.insert('end', f"{'manejador':<44}{'n':>7}{'media':>8}{'p95≤':>8}{'máx':>8}"
+                              f"{'>' + format(FRAME_MS, 'g') + 'ms':>9}  histograma\n", "head")
+            for name, st in UI_LATENCY.slowest(order.get())[:30]:
+                peak = max(st["hist"]) or 1
+                hist = "".join(bars[min(8, -(-c * 8 // peak))] for c in st["hist"])
+                line = (f"{name[-43:]:<44}{st['n']:>7}{st['total'] / st['n']:>8.1f}"
+                        f"{UILatency.percentile(st, 0.95):>8.1f}{st['max']:>8.1f}{st['slow']:>9}  {hist}\n")
+                txt.insert('end', line, "slow" if st["slow"] else ())
+            win.after(500, refresh)
+        refresh()
+
+    def export_latency_trace(self):
+        path = filedialog.asksaveasfilename(title="Exportar traza de latencia", defaultextension=".json",
+                                            initialfile="runpad-ui-trace.json",
+                                            filetypes=[("Chrome trace", "*.json")])
+        if not path: return
+        try:
+            n = UI_LATENCY.export_trace(path)
+            self._set_status(f"Traza exportada ({n} eventos): {path} — abrir en chrome://tracing o ui.perfetto.dev")
+        except OSError as e:
+            messagebox.showerror("Exportar traza", str(e))
+
+    def open_history_panel(self):
+        if self.history is None:
+            messagebox.showerror("Historial", f"No se pudo abrir {HISTORY_PATH}"); return
+        win = tk.Toplevel(self.root); win.title("Historial de ejecuciones"); win.configure(bg=BG_COLOR)
+        win.geometry("1000x600")
+        top = tk.Frame(win, bg=BG_COLOR); top.pack(fill='x', padx=6, pady=6)
+        tk.Label(top, text="Marcar si es más lento que la mediana móvil en (%):",
+                 bg=BG_COLOR, fg=FG_COLOR).pack(side='left')
+        pct_var = tk.StringVar(value=str(self.settings.get("history_regression_pct", 25)))
+        tk.Entry(top, textvariable=pct_var, width=6, bg=PANEL_BG, fg=FG_COLOR,
+                 insertbackground=FG_COLOR, relief="flat").pack(side='left', padx=6)
+
+        body = tk.PanedWindow(win, orient='horizontal', bg=BG_COLOR, sashrelief='flat', sashwidth=6)
+        body.pack(fill='both', expand=True, padx=6, pady=(0,6))
+        scripts_box = tk.Listbox(body, bg=PANEL_BG, fg=FG_COLOR, selectbackground=ACCENT,
+                                 selectforeground="#0b0b0b", font=("Consolas",10), relief="flat",
+                                 exportselection=False)
+        body.add(scripts_box, width=300)
+        right = tk.Frame(body, bg=BG_COLOR); body.add(right, stretch="always")
+        chart = tk.Canvas(right, height=180, bg=EDITOR_BG, highlightthickness=0)
+        chart.pack(fill='x')
+        runs_txt = tk.Text(right, bg=BG_COLOR, fg=FG_COLOR, font=("Consolas",10), relief="flat", wrap='none')
+        runs_txt.pack(fill='both', expand=True, pady=(6,0))
+        runs_txt.tag_configure("slow", foreground="#ff5f56")
+        runs_txt.tag_configure("head", foreground=ACCENT)
+
+        rows = self.history.scripts()
+        scripts = [(r[0], r[1]) for r in rows]
+        for sc, variant, n, _last in rows:
+            scripts_box.insert('end', f"{os.path.basename(sc)}{f' [{variant}]' if variant else ''}  ({n})")
+        state = {"runs": []}
+
+        def render(_e=None):
+            sel = scripts_box.curselection()
+            if not sel: return
+            try: pct = float(pct_var.get())
+            except ValueError: pct = 25.0
+            self.settings["history_regression_pct"] = pct
+            script, variant = scripts[sel[0]]
+            runs = self.history.runs_for(script, variant)
+            state["runs"] = runs
+            ok_runs = [r for r in runs if r["exit_code"] == 0 and r["duration"] is not None]
+            flags = dict(zip((r["id"] for r in ok_runs),
+                             _rolling_regressions([r["duration"] for r in ok_runs], pct)))
+            runs_txt.config(state='normal'); runs_txt.delete('1.0', 'end')
+            runs_txt.insert('end', f"{script}{f'  [{variant}]' if variant else ''}\n", "head")
+            runs_txt.insert('end', f"{'inicio':<20}{'duración':>11}{'salida':>10}{'cpu (s)':>10}{'rss (MB)':>10}  sha1\n", "head")
+            for r in reversed(runs):
+                med, slow = flags.get(r["id"], (None, False))
+                cpu = (r["cpu_user"] or 0) + (r["cpu_sys"] or 0)
+                rss = f"{r['max_rss_kb'] / 1024:.1f}" if r["max_rss_kb"] else "-"
+                line = (f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(r['started'])):<20}"
+                        f"{r['duration'] or 0:>10.2f}s{str(r['exit_code']):>10}{cpu:>10.2f}{rss:>10}  "
+                        f"{(r['sha1'] or '-')[:10]}")
+                if slow: line += f"   ▲ +{(r['duration'] / med - 1) * 100:.0f}% vs mediana {med:.2f}s"
+                runs_txt.insert('end', line + "\n", "slow" if slow else ())
+            runs_txt.config(state='disabled')
+            self._draw_duration_chart(chart, ok_runs, flags)
+
+        def open_log(event):
+            line = int(runs_txt.index(f"@{event.x},{event.y}").split('.')[0]) - 3
+            runs = list(reversed(state["runs"]))
+            if 0 <= line < len(runs) and runs[line]["log_path"]:
+                self._show_run_log(runs[line]["log_path"])
+
+        scripts_box.bind("<<ListboxSelect>>", render)
+        pct_var.trace_add("write", lambda *_: render())
+        chart.bind("<Configure>", render)
+        runs_txt.bind("<Double-Button-1>", open_log)
+        if scripts:
+            scripts_box.selection_set(0); render()
+
+    def _draw_duration_chart(self, chart, runs, flags):
+        chart.delete("all")
+        w = max(chart.winfo_width(), 200); h = max(chart.winfo_height(), 100); pad = 24
+        if not runs:
+            chart.create_text(w // 2, h // 2, text="Sin ejecuciones correctas", fill=FG_COLOR); return
+        top = max(r["duration"] for r in runs) or 1.0
+        step = (w - 2 * pad) / max(1, len(runs) - 1)
+        xy = lambda i, d: (pad + i * step, h - pad - (h - 2 * pad) * d / top)
+        pts = [xy(i, r["duration"]) for i, r in enumerate(runs)]
+        meds = [(i, flags[r["id"]][0]) for i, r in enumerate(runs) if flags[r["id"]][0] is not None]
+        if len(pts) > 1: chart.create_line(*[c for pt in pts for c in pt], fill=ACCENT_2, width=2)
+        if len(meds) > 1: chart.create_line(*[c for i, m in meds for c in xy(i, m)], fill="#777777", dash=(4, 2))
+        for (x, y), r in zip(pts, runs):
+            slow = flags[r["id"]][1]
+            chart.create_oval(x - 3, y - 3, x + 3, y + 3, fill="#ff5f56" if slow else ACCENT_3, outline="")
+        chart.create_text(pad, 10, text=f"máx {top:.2f}s", fill=FG_COLOR, anchor='w')
+        chart.create_text(w - pad, 10, text="— duración   - - mediana móvil   ● regresión",
+                          fill="#9e9e9e", anchor='e')
+
+    def _show_run_log(self, path, line=None):
+        # solo la ventana alrededor de `line` (o el final): un log de GB no pasa entero por la consola
+        try:
+            first, lines, total = _read_log_window(path, line)
+        except (OSError, zlib.error) as e:
+            messagebox.showerror("Historial", f"No se pudo leer el log:\n{e}"); return
+        span = f" (líneas {first}–{first + len(lines) - 1} de {total})" if len(lines) < total else ""
+        if line:
+            body = "".join(f"{'▶' if n == line else ' '}{n:>7}│ {l}\n" for n, l in enumerate(lines, first))
+        else:
+            body = "".join(l + "\n" for l in lines)
+        self.output_queue.put(f"\n=== Log: {path}{span} ===\n{body}=== Fin del log ===\n")
+
+    def open_log_search(self):
+        win = getattr(self, "_log_search_win", None)
+        if win is not None and win.winfo_exists():
+            win.lift(); return
+        win = self._log_search_win = tk.Toplevel(self.root)
+        win.title("Buscar en ejecuciones"); win.configure(bg=BG_COLOR); win.geometry("1000x600")
+        top = tk.Frame(win, bg=BG_COLOR); top.pack(fill='x', padx=6, pady=6)
+        tk.Label(top, text="Regex:", bg=BG_COLOR, fg=FG_COLOR).pack(side='left')
+        pat_var = tk.StringVar()
+        entry = tk.Entry(top, textvariable=pat_var, width=40, bg=PANEL_BG, fg=FG_COLOR,
+                         insertbackground=FG_COLOR, relief="flat")
+        entry.pack(side='left', padx=6)
+        case_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(top, text="Mayúsculas", variable=case_var, bg=BG_COLOR, fg=FG_COLOR,
+                       selectcolor=PANEL_BG, activebackground=BG_COLOR).pack(side='left')
+        scope_var = tk.StringVar(value="Esta sesión")
+        scope_box = ttk.Combobox(top, textvariable=scope_var, values=["Esta sesión", "Todas"], state='readonly', width=12)
+        scope_box.pack(side='left', padx=6)
+        script_var = tk.StringVar(value="Todos")
+        script_box = ttk.Combobox(top, textvariable=script_var, state='readonly', width=28)
+        script_box.pack(side='left')
+        status = tk.Label(win, text="Doble clic en un resultado para abrir el log en esa línea",
+                          anchor='w', bg=BG_COLOR, fg=ACCENT_2)
+        status.pack(fill='x', padx=6)
+        body = tk.Frame(win, bg=BG_COLOR); body.pack(fill='both', expand=True, padx=6, pady=(0,6))
+        results = tk.Text(body, bg=BG_COLOR, fg=FG_COLOR, font=("Consolas",10), relief="flat", wrap='none')
+        results.pack(side='left', fill='both', expand=True)
+        sb = ttk.Scrollbar(body, orient='vertical', command=results.yview, style="Dark.Vertical.TScrollbar")
+        sb.pack(side='right', fill='y'); results.config(yscrollcommand=sb.set, state='disabled')
+        results.tag_configure("head", foreground=ACCENT)
+        results.tag_configure("pos", foreground="#9e9e9e")
+        results.tag_configure("match", foreground=ACCENT_2, underline=True)
+        targets = {}   # etiqueta → (log, línea)
+
+        def logs_in_scope():
+            return _list_run_logs(None if scope_var.get() == "Todas" else self._session_started)
+
+        def refresh_scripts(_e=None):
+            names = sorted({_log_script_name(p) for p in logs_in_scope()}, key=str.lower)
+            script_box.config(values=["Todos"] + names)
+            if script_var.get() not in names: script_var.set("Todos")
+        scope_box.bind("<<ComboboxSelected>>", refresh_scripts)
+        refresh_scripts()
+
+        def show(gen, path, found, rx):
+            if gen != self._log_search_gen or not win.winfo_exists(): return
+            results.config(state='normal')
+            results.insert('end', f"{_log_script_name(path)}  ·  {os.path.basename(path)}  ·  "
+                                  f"{len(found)} coincidencia(s)\n", "head")
+            for line, when, ctx in found:
+                tag = f"hit:{len(targets)}"; targets[tag] = (path, line)
+                stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(when)) if when else "—"
+                results.insert('end', f"  línea {line}  ·  ~{stamp}\n", ("pos", tag))
+                for n, text in ctx:
+                    start = results.index('end-1c')
+                    prefix = f"  {'▶' if n == line else ' '}{n:>7}│ "
+                    results.insert('end', prefix + text + "\n", (tag,))
+                    if n != line: continue
+                    for m in rx.finditer(text):
+                        a, b = len(prefix) + m.start(), len(prefix) + m.end()
+                        results.tag_add("match", f"{start}+{a}c", f"{start}+{b}c")
+                results.insert('end', "\n")
+            results.config(state='disabled')
+
+        def done(gen, text):
+            if gen == self._log_search_gen and win.winfo_exists(): status.config(text=text)
+
+        def search(_e=None):
+            pattern = pat_var.get()
+            if not pattern: return
+            try: rx = re.compile(pattern, 0 if case_var.get() else re.IGNORECASE)
+            except re.error as e:
+                status.config(text=f"Regex no válida: {e}"); return
+            literal = _plain_literal(pattern) if case_var.get() else None
+            self._log_search_gen += 1; gen = self._log_search_gen
+            cancelled = lambda: gen != self._log_search_gen
+            targets.clear()
+            results.config(state='normal'); results.delete('1.0', 'end'); results.config(state='disabled')
+            logs = logs_in_scope()
+            if script_var.get() != "Todos": logs = [p for p in logs if _log_script_name(p) == script_var.get()]
+            status.config(text=f"Buscando en {len(logs)} log(s)…")
+
+            def worker():
+                t0 = time.monotonic(); hits = 0; hit_logs = 0
+                for i, path in enumerate(logs):
+                    if cancelled(): return
+                    try:
+                        found = list(_search_log(path, rx, literal, max_hits=LOG_SEARCH_MAX_HITS - hits,
+                                                 cancelled=cancelled))
+                    except (OSError, zlib.error):
+                        continue
+                    if found:
+                        hits += len(found); hit_logs += 1
+                        self.ui_calls.put(lambda p=path, f=found: show(gen, p, f, rx))
+                    if hits >= LOG_SEARCH_MAX_HITS: break
+                    if i % 20 == 19:
+                        text = f"Buscando… {i + 1}/{len(logs)} logs, {hits} coincidencia(s)"
+                        self.ui_calls.put(lambda t=text: done(gen, t))
+                if cancelled(): return
+                more = f" (límite de {LOG_SEARCH_MAX_HITS})" if hits >= LOG_SEARCH_MAX_HITS else ""
+                text = (f"{hits} coincidencia(s){more} en {hit_logs} de {len(logs)} log(s) · "
+                        f"{time.monotonic() - t0:.2f} s")
+                self.ui_calls.put(lambda: done(gen, text))
+            threading.Thread(target=worker, daemon=True).start()
+
+        def stop():
+            self._log_search_gen += 1; status.config(text="Búsqueda detenida")
+
+        def open_hit(event):
+            for tag in results.tag_names(f"@{event.x},{event.y}"):
+                if tag in targets:
+                    self._show_run_log(*targets[tag]); return "break"
+
+        self._btn_sm(top, "Buscar", search).pack(side='left', padx=6)
+        self._btn_sm(top, "Detener", stop).pack(side='left')
+        entry.bind("<Return>", search)
+        results.bind("<Double-Button-1>", open_hit)
+        win.protocol("WM_DELETE_WINDOW", lambda: (stop(), win.destroy()))
+        entry.focus_set()
+
+    # ========= Kernel =========
+    def kernel_start(self):
+        if self.kernel is not None and self.kernel.poll() is None: return self.kernel
+        path = os.path.abspath(self.current_file) if self.current_file else None
+        cwd = os.path.dirname(path) if path else self.current_directory
+        env = dict(os.environ, RUNPAD_KERNEL_SENTINEL=KERNEL_SENTINEL, RUNPAD_KERNEL_FILE=path or "",
+                   PYTHONIOENCODING="utf-8")
+        try:
+            p = self.supervisor.spawn([sys.executable, "-u", "-c", KERNEL_SRC], cwd, env=env,
+                                      stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                      stderr=subprocess.STDOUT, text=True, encoding="utf-8",
+                                      errors="replace")
+        except Exception as e:
+            self.output_queue.put(f"\n[Kernel: no se pudo iniciar: {e}]\n"); return None
+        # el kernel no es una ejecución: "Detener" no debe matarlo
+        self.supervisor.release(p)
+        p.inbox = queue.Queue()
+        self.kernel = p; self._kernel_pending = 0
+        threading.Thread(target=self._kernel_reader, args=(p,), daemon=True).start()
+        threading.Thread(target=self._kernel_writer, args=(p,), daemon=True).start()
+        self.output_queue.put(f"\n[Kernel iniciado en {cwd} (pid {p.pid})]\n")
+        return p
+
+    def _kernel_writer(self, p):
+        while True:
+            item = p.inbox.get()
+            if item is None: return
+            try:
+                p.stdin.buffer.write(item); p.stdin.buffer.flush()
+            except (OSError, ValueError):
+                return
+
+    def _kernel_reader(self, p):
+        held = None  # salto de línea retenido por si precede al centinela
+        for line in p.stdout:
+            if line.rstrip("\n") == KERNEL_SENTINEL:
+                held = None
+                self.ui_calls.put(lambda: self._kernel_done(p)); continue
+            if held is not None: self.output_queue.put(held)
+            held = line if line == "\n" else None
+            if held is None: self.output_queue.put(line)
+        code, _ = self.supervisor.wait(p)
+        self.output_queue.put(f"\n[Kernel terminado ({_describe_exit(code)})]\n")
+        self.ui_calls.put(lambda: self._kernel_done(p, exited=True))
+
+    def _kernel_done(self, p, exited=False):
+        if p is not self.kernel: return
+        if exited:
+            self.kernel = None; self._kernel_pending = 0
+            self._set_status("Kernel detenido"); return
+        self._kernel_pending = max(0, self._kernel_pending - 1)
+        self._set_status("Kernel: listo" if not self._kernel_pending else f"Kernel: ocupado ({self._kernel_pending} en cola)")
+
+    def kernel_send(self, code, first_line=1):
+        if not code.strip(): return
+        p = self.kernel_start()
+        if p is None: return
+        # relleno para que los tracebacks apunten a la línea real del archivo
+        src = "\n" * (first_line - 1) + code
+        name = os.path.abspath(self.current_file) if self.current_file else "<editor>"
+        # en bytes: el stdin en modo texto traduciría \n a \r\n en Windows y el tamaño no cuadraría
+        data = src.encode("utf-8")
+        p.inbox.put(f"{len(data)} {name}\n".encode("utf-8") + data)
+        self._kernel_pending += 1
+        self._set_status(f"Kernel: ocupado ({self._kernel_pending} en cola)")
+
+    def kernel_run_selection(self):
+        try:
+            first = self.editor.index("sel.first linestart")
+            code = self.editor.get(first, "sel.last")
+        except tk.TclError:
+            first = self.editor.index("insert linestart")
+            code = self.editor.get(first, "insert lineend")
+            self.editor.mark_set(tk.INSERT, "insert +1l linestart"); self.editor.see(tk.INSERT)
+        self.kernel_send(code, int(first.split('.')[0]))
+
+    def _cell_bounds(self, line):
+        lines = self.editor.get('1.0', 'end-1c').split("\n")
+        is_mark = lambda l: l.lstrip().startswith("# %%") or l.lstrip().startswith("#%%")
+        start = line
+        while start > 1 and not is_mark(lines[start - 1]): start -= 1
+        end = line + 1
+        while end <= len(lines) and not is_mark(lines[end - 1]): end += 1
+        return start, end  # [start, end) en números de línea
+
+    def kernel_run_cell(self):
+        start, end = self._cell_bounds(int(self._cursor_line()))
+        code = self.editor.get(f"{start}.0", f"{end}.0")
+        self.kernel_send(code, start)
+        self.editor.mark_set(tk.INSERT, f"{end}.0"); self.editor.see(tk.INSERT)
+
+    def kernel_run_buffer(self):
+        self.kernel_send(self.editor.get('1.0', 'end-1c'))
+
+    def kernel_interrupt(self):
+        p = self.kernel
+        if p is None or p.poll() is not None:
+            self._set_status("Kernel no iniciado"); return
+        try:
+            os.kill(p.pid, signal.CTRL_BREAK_EVENT if os.name == "nt" else signal.SIGINT)
+            self._set_status("Kernel: interrupción enviada")
+        except Exception as e:
+            self._set_status(f"Kernel: no se pudo interrumpir: {e}")
+
+    def kernel_stop(self):
+        p, self.kernel = self.kernel, None
+        self._kernel_pending = 0
+        if p is None: return
+        p.inbox.put(None)
+        threading.Thread(target=self.supervisor.terminate, args=(p, 1.0), daemon=True).start()
+        self._set_status("Kernel detenido")
+
+    def kernel_restart(self):
+        self.kernel_stop()
+        self.kernel_start()
+        self._set_status("Kernel reiniciado")
 
     # ========= Terminal =========
     def open_terminal(self):
@@ -999,6 +4126,10 @@ class RunPad:
     # ========= Consola =========
     def clear_output(self):
         self.output.config(state='normal'); self.output.delete('1.0','end'); self.output.config(state='normal')
+        for tag in self._links: self.output.tag_delete(tag)
+        self._links.clear()
+        self.console.reset()
+        self.output.mark_set("live", "end-1c")
 
     def copy_output(self):
         txt = self.output.get('1.0','end-1c')
@@ -1006,12 +4137,75 @@ class RunPad:
         self._set_status("Salida copiada")
 
     def _append_output(self, text):
-        self.output.insert('end', text); self.output.see('end')
+        self._feed_console(text); self._render_console()
+
+    def _feed_console(self, text):
+        if isinstance(text, tuple) and isinstance(text[1], str):
+            # (texto, script): salida de una ejecución, filtrable por script
+            text, script = text
+            tag = self._sources.get(script)
+            if tag is None:
+                tag = self._sources[script] = f"src:{len(self._sources)}"
+                self.console_filter.config(values=["Todos"] + self._source_labels())
+                self._apply_console_filter()
+            self.console.write(text, source=tag)
+        elif isinstance(text, tuple):
+            # (texto, (ruta, línea)): enlace que abre el archivo en esa línea
+            text, target = text
+            tag = f"link:{len(self._links)}"; self._links[tag] = target
+            self.console.write(text, ("link", tag))
+        else:
+            self.console.write(text)
+
+    def _source_labels(self):
+        # nombre del script; la ruta completa solo si dos comparten nombre
+        names = [os.path.basename(sc) for sc in self._sources]
+        return [n if names.count(n) == 1 else sc for sc, n in zip(self._sources, names)]
+
+    def _apply_console_filter(self):
+        # las líneas de otros scripts se ocultan (elide), no se borran: "Todos" las recupera
+        choice = self.console_filter_var.get()
+        for label, tag in zip(self._source_labels(), self._sources.values()):
+            self.output.tag_configure(tag, elide=choice not in ("Todos", label))
+
+    def _render_console(self):
+        # un solo redibujo por cuadro: se confirma lo nuevo y se reemplaza la línea viva
+        done, live = self.console.flush()
+        out = self.output
+        out.delete("live", "end-1c")
+        args = [x for seg, tags in done for x in (seg, tags)]
+        if args: out.insert("end", *args)
+        out.mark_set("live", "end-1c")
+        args = [x for seg, tags in live for x in (seg, tags)]
+        if args: out.insert("end", *args)
+        out.see("end")
+
+    def _on_output_link(self, event):
+        for tag in self.output.tag_names(f"@{event.x},{event.y}"):
+            if tag in self._links:
+                path, line = self._links[tag]
+                self.open_path(path, line); return "break"
+
+    DRAIN_BUDGET = 0.02  # s por cuadro; lo que sobre queda para el siguiente
 
     def _drain_output_queue(self):
+        deadline = time.monotonic() + self.DRAIN_BUDGET
+        try:
+            n = 0
+            while True:
+                s = self.output_queue.get_nowait()
+                if s is CLEAR_CONSOLE: self.clear_output()
+                else: self._feed_console(s)
+                n += 1
+                if n % 256 == 0 and time.monotonic() > deadline: break
+        except queue.Empty:
+            pass
+        if self.console.dirty: self._render_console()
         try:
             while True:
-                s = self.output_queue.get_nowait(); self._append_output(s)
+                fn = self.ui_calls.get_nowait()
+                try: fn()
+                except Exception as e: self._set_status(f"Error: {e}")
         except queue.Empty:
             pass
         self.root.after(50, self._drain_output_queue)
@@ -1082,26 +4276,31 @@ class RunPad:
 
     def _cursor_line(self): return self.editor.index(tk.INSERT).split('.')[0]
     def _cursor_col(self):  return self.editor.index(tk.INSERT).split('.')[1]
-    def _update_status_caret(self): self._set_status("Listo")
+    def _update_status_caret(self):
+        self._set_status(self._diag_msgs.get(int(self._cursor_line()), "Listo"))
 
     def _maybe_discard_changes(self, mode="prompt"):
         if not self.file_modified:
             return True
         if mode == "nav":
-            if self.current_file:
-                try:
-                    with open(self.current_file, 'w', encoding='utf-8') as f:
-                        f.write(self.editor.get('1.0', 'end-1c'))
-                    self.file_modified = False
-                    self._set_status(f"Guardado: {os.path.basename(self.current_file)}")
-                except Exception:
-                    pass
-            return True
+            return True  # navegar no toca el archivo: los cambios siguen en su pestaña y en el diario
         r = messagebox.askyesnocancel("Cambios sin guardar", "¿Guardar cambios?")
         if r is None: return False
         if r: self.save_file(show_popup=False)
         return True
 
+    def _confirm_close_docs(self):
+        pending = [d for d in self.docs if (self.file_modified if d is self.doc else d["modified"])]
+        if not pending: return True
+        names = ", ".join(self._doc_title(d).rstrip(" •") for d in pending)
+        r = messagebox.askyesnocancel("Cambios sin guardar", f"{len(pending)} pestaña(s) con cambios: {names}\n¿Guardarlas?")
+        if r is None: return False
+        if r:
+            for d in pending:
+                self.switch_doc(d); self.save_file(show_popup=False)
+                if self.file_modified: return False  # falló el guardado
+        return True
+
     def _on_close(self):
         self.settings["wrap"] = bool(self.wrap.get())
         self.settings["font_size"] = int(self.font_size.get())
@@ -1109,11 +4308,22 @@ class RunPad:
         self.settings["number_color"] = self.number_color.get()
         self.settings["alpha_color"]  = self.alpha_color.get()
         save_settings(self.settings)
-        if not self._maybe_discard_changes(mode="prompt"): return
-        try: self.stop_all()
+        if not self._confirm_close_docs(): return
+        for doc in self.docs: self._journal_drop(doc)
+        batch = getattr(self, "_batch", None)
+        if batch is not None: batch.stop.set()   # no lanzar más; lo pendiente queda para "Reanudar lote"
+        try:
+            self.journal.close()
+            self.linter.close()
+            if self.kernel is not None: self.supervisor.terminate(self.kernel, 1.0)
+            self.supervisor.terminate_all(grace=1.0)
         except Exception: pass
+        self._restore_call_wrapper()
         self.root.destroy()
 
+    def _restore_call_wrapper(self):
+        if tk.CallWrapper is _TimedCallWrapper: tk.CallWrapper = self._orig_call_wrapper
+
     # ========= Persistencia automatizador =========
     def _persist_automator(self):
         if not self.settings.get("persist_automator", True):
@@ -1124,6 +4334,10 @@ class RunPad:
 
 # ========= Main =========
 if __name__ == "__main__":
+    if "--agent" in sys.argv:
+        sys.exit(_agent_main(sys.argv[1:]))
+    STARTUP.mark("importaciones")
     root = tk.Tk()
+    STARTUP.mark("tk.Tk()")
     app = RunPad(root)
     root.mainloop()